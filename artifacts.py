@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+class ArtifactStore:
+    # Per-session store for generated reports, keyed by (workbook key, artifact name).
+    # Artifacts live in memory up to max_bytes; least recently used ones spill to a private
+    # temporary directory (bounded by max_spill_bytes) or are dropped when spilling is disabled.
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, spill=True, max_spill_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled = OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+        self._spill_dir = None
+        if spill:
+            self._spill_dir = tempfile.mkdtemp(prefix="vba_artifacts_")
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+
+    def put(self, workbook_key, name, content):
+        data = content.encode('utf-8') if isinstance(content, str) else bytes(content)
+        entry = (isinstance(content, str), data)
+        key = (workbook_key, name)
+        with self._lock:
+            self._discard(key)
+            self._memory[key] = entry
+            self._memory_bytes += len(data)
+            self._evict()
+        return content
+
+    def get(self, workbook_key, name, default=None):
+        key = (workbook_key, name)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif key in self._spilled:
+                # Spilled artifacts are read back and promoted to the memory tier
+                path, size, is_text = self._spilled.pop(key)
+                self._spilled_bytes -= size
+                with open(path, 'rb') as f:
+                    entry = (is_text, f.read())
+                os.remove(path)
+                self._memory[key] = entry
+                self._memory_bytes += size
+                self._evict()
+            else:
+                return default
+        is_text, data = entry
+        return data.decode('utf-8') if is_text else data
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._spilled
+
+    def _discard(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+        spilled = self._spilled.pop(key, None)
+        if spilled is not None:
+            self._spilled_bytes -= spilled[1]
+            os.remove(spilled[0])
+
+    def _evict(self):
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            key, (is_text, data) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            if self._spill_dir is None or len(data) > self.max_spill_bytes:
+                continue
+            fd, path = tempfile.mkstemp(dir=self._spill_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._spilled[key] = (path, len(data), is_text)
+            self._spilled_bytes += len(data)
+
+        while self._spilled_bytes > self.max_spill_bytes:
+            _, (path, size, _) = self._spilled.popitem(last=False)
+            self._spilled_bytes -= size
+            os.remove(path)
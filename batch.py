@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from llm_scheduler import PRIORITY_BATCH
+from tracing import in_current_span, span
+from vba_callgraph import to_graphml
+from vba_corpus import CorpusIndex, corpus_entries
+from vba_pipeline import (
+    ANALYSIS_PROMPTS,
+    CORPUS_PATH,
+    build_security_report,
+    extract_nodes_and_links,
+    extract_vba_modules,
+    get_call_graph,
+    get_procedure_index,
+    hash_file,
+    join_bas_modules,
+    lint_vba_modules,
+    llm_scheduler,
+    run_named_analysis,
+    warm_up_llm
+)
+
+WORKBOOK_EXTENSIONS = ('.xls', '.xlsm', '.xlsb', '.xla', '.xlam')
+RESULT_FILE = 'result.json'
+
+def find_workbooks(input_dir):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.lower().endswith(WORKBOOK_EXTENSIONS) and not file_name.startswith('~$'):
+                yield os.path.join(root, file_name)
+
+def write_atomic(path, content):
+    # Results only appear once fully written, so an interrupted run never leaves a half-written file behind
+    with span('write_file', file=os.path.basename(path), bytes=len(content)):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+def load_result(result_dir):
+    result_path = os.path.join(result_dir, RESULT_FILE)
+    if not os.path.exists(result_path):
+        return None
+    with open(result_path, 'r') as f:
+        return json.load(f)
+
+def process_workbook(workbook_path, result_dir):
+    with span('process_workbook', workbook=workbook_path) as current:
+        workbook_hash = hash_file(workbook_path)
+        previous = load_result(result_dir)
+        if previous is not None and previous.get('workbook_hash') == workbook_hash:
+            current.set(skipped=True)
+            return previous, True
+
+        os.makedirs(result_dir, exist_ok=True)
+        result = {'workbook': workbook_path, 'workbook_hash': workbook_hash}
+        vba_modules = extract_vba_modules(workbook_path)
+        if vba_modules is None:
+            result['status'] = 'no_macros'
+        else:
+            vba_code = join_bas_modules(vba_modules)
+            nodes, links = extract_nodes_and_links(vba_modules)
+            security_report, security_findings = build_security_report(vba_modules)
+            result.update({
+                'status': 'ok' if vba_code else 'no_code',
+                'modules': [{'stream_path': stream_path, 'name': vba_name} for stream_path, vba_name, _ in vba_modules],
+                'security_report': security_report,
+                'security_findings': security_findings,
+                'static_analysis': lint_vba_modules(vba_modules),
+                'nodes': nodes,
+                'links': links
+            })
+            write_atomic(os.path.join(result_dir, 'vba_code.txt'), vba_code)
+            write_atomic(os.path.join(result_dir, 'call_graph.graphml'), to_graphml(get_call_graph(vba_modules)))
+
+        write_atomic(os.path.join(result_dir, RESULT_FILE), json.dumps(result, indent=2))
+        return result, False
+
+def fingerprint_workbook(workbook_path):
+    vba_modules = extract_vba_modules(workbook_path)
+    if vba_modules is None:
+        return []
+    return corpus_entries(get_procedure_index(vba_modules))
+
+def run_workbook_analysis(workbook_path, vba_code, analysis, priority):
+    # The modules come out of the extraction cache the worker process filled
+    return run_named_analysis(vba_code, extract_vba_modules(workbook_path), analysis, priority)
+
+async def llm_worker(queue):
+    while True:
+        result_dir, analysis, workbook_path, vba_code = await queue.get()
+        try:
+            response = await asyncio.to_thread(
+                in_current_span(run_workbook_analysis, 'batch_analysis', analysis=analysis, result_dir=result_dir),
+                workbook_path, vba_code, analysis, PRIORITY_BATCH
+            )
+            write_atomic(os.path.join(result_dir, f'{analysis}.txt'), response)
+        except Exception as error:
+            print(f"LLM analysis '{analysis}' failed for {result_dir}: {error}", file=sys.stderr)
+        finally:
+            queue.task_done()
+
+def queue_llm_analyses(queue, result, result_dir, analyses):
+    if result.get('status') != 'ok':
+        return
+    with open(os.path.join(result_dir, 'vba_code.txt'), 'r') as f:
+        vba_code = f.read()
+    for analysis in analyses:
+        if not os.path.exists(os.path.join(result_dir, f'{analysis}.txt')):
+            queue.put_nowait((result_dir, analysis, result['workbook'], vba_code))
+
+async def run_batch(input_dir, output_dir, workers, analyses, llm_concurrency, corpus_path=None):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    llm_scheduler.max_concurrency = llm_concurrency
+    if analyses:
+        warm_up_llm()
+    llm_tasks = [asyncio.create_task(llm_worker(queue)) for _ in range(llm_concurrency if analyses else 0)]
+    summary = {'processed': 0, 'skipped': 0, 'failed': 0}
+    corpus = CorpusIndex(corpus_path) if corpus_path else None
+
+    async def run_one(pool, workbook_path):
+        relative_path = os.path.relpath(workbook_path, input_dir)
+        result_dir = os.path.join(output_dir, relative_path)
+        try:
+            result, skipped = await loop.run_in_executor(pool, process_workbook, workbook_path, result_dir)
+        except Exception as error:
+            summary['failed'] += 1
+            print(f"FAILED   {relative_path}: {error}", file=sys.stderr)
+            return
+        summary['skipped' if skipped else 'processed'] += 1
+        print(f"{'SKIPPED' if skipped else 'DONE':<8} {relative_path} ({result['status']})")
+        queue_llm_analyses(queue, result, result_dir, analyses)
+
+        # Procedure fingerprints are computed in the worker processes; only the index writes happen here
+        if corpus is not None and not corpus.is_current(workbook_path, result['workbook_hash']):
+            try:
+                entries = await loop.run_in_executor(pool, fingerprint_workbook, workbook_path)
+            except Exception as error:
+                print(f"Corpus indexing failed for {relative_path}: {error}", file=sys.stderr)
+                return
+            corpus.add_workbook(workbook_path, result['workbook_hash'], entries)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        await asyncio.gather(*(run_one(pool, path) for path in find_workbooks(input_dir)))
+
+    await queue.join()
+    for task in llm_tasks:
+        task.cancel()
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and analyze VBA macros from every workbook under a directory.")
+    parser.add_argument('input_dir', help="Directory tree to scan for .xls/.xlsm workbooks")
+    parser.add_argument('--output-dir', default='batch_outputs', help="Directory that receives per-workbook results")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of extraction processes")
+    parser.add_argument('--llm', nargs='*', default=[], choices=sorted(ANALYSIS_PROMPTS), help="LLM analyses to run per workbook")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Maximum number of concurrent LLM requests")
+    parser.add_argument('--corpus', nargs='?', const=CORPUS_PATH, default=None,
+                        help="Add every workbook's procedures to the corpus index (default: the app's index)")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run_batch(args.input_dir, args.output_dir, args.workers, args.llm, args.llm_concurrency, args.corpus))
+    print(f"Processed {summary['processed']}, skipped {summary['skipped']} already complete, {summary['failed']} failed.")
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
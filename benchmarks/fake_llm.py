@@ -0,0 +1,58 @@
+import hashlib
+import re
+import threading
+import time
+from collections import namedtuple
+
+Message = namedtuple('Message', ['content'])
+HEADER_PATTERN = re.compile(r'^~ .+$', re.MULTILINE)
+
+class FakeChatModel:
+    # Deterministic stand-in for the chat model: the response depends only on the prompt, and each call
+    # sleeps for a fixed latency plus a per-output-token delay so LLM stages can be timed offline.
+
+    def __init__(self, latency=0.2, response_tokens=200, seconds_per_token=0.0):
+        self.latency = latency
+        self.response_tokens = response_tokens
+        self.seconds_per_token = seconds_per_token
+        self.request_latencies = []
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def response_words(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return [f"word{digest[index % len(digest)]}{index}" for index in range(self.response_tokens)]
+
+    def response_text(self, prompt):
+        # Batched documentation prompts mark each procedure with a "~ <key>" line; like a model that
+        # follows the prompt, the response repeats each header before that procedure's documentation
+        headers = HEADER_PATTERN.findall(prompt)
+        if not headers:
+            return " ".join(self.response_words(prompt))
+        return "\n".join(f"{header}\n{' '.join(self.response_words(prompt + header))}" for header in headers)
+
+    def _record(self, prompt, started):
+        with self._lock:
+            self.request_latencies.append(time.perf_counter() - started)
+            self.prompt_chars += len(prompt)
+
+    def invoke(self, prompt):
+        started = time.perf_counter()
+        words = self.response_text(prompt).split(" ")
+        time.sleep(self.latency + self.seconds_per_token * len(words))
+        self._record(prompt, started)
+        return Message(" ".join(words))
+
+    def stream(self, prompt):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        for word in self.response_text(prompt).split(" "):
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            yield Message(word + " ")
+        self._record(prompt, started)
+
+    def reset(self):
+        with self._lock:
+            self.request_latencies = []
+            self.prompt_chars = 0
@@ -0,0 +1,259 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The pipeline reads its cache location and backend at import time, so both are set first:
+# benchmarks never touch the real caches, and the chat client is replaced by the fake below
+BENCHMARK_DIR = tempfile.mkdtemp(prefix="vba_benchmark_")
+os.environ["VBA_CACHE_DIR"] = os.path.join(BENCHMARK_DIR, "cache")
+os.environ.setdefault("VBA_LLM_BACKEND", "openai")
+
+import vba_pipeline
+from cache import DiskCache
+from vba_corpus import CorpusIndex
+from vba_index import build_index
+from vba_lint import lint_index
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.synthetic import SCALES, generate_project, write_project
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(values, percent):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def summarize(durations, items):
+    total = sum(durations)
+    summary = {
+        'runs': len(durations),
+        'mean_ms': total / len(durations) * 1000,
+        'min_ms': min(durations) * 1000,
+        'max_ms': max(durations) * 1000,
+        'throughput': items * len(durations) / total if total else float('inf')
+    }
+    for percent in PERCENTILES:
+        summary[f'p{percent}_ms'] = percentile(durations, percent) * 1000
+    return summary
+
+def reset_pipeline_state():
+    # Every run starts cold: in-memory indexes, finished jobs and the on-disk caches are emptied
+    vba_pipeline.procedure_indexes.clear()
+    vba_pipeline.lint_results.clear()
+    vba_pipeline.job_queue.clear()
+    directory = tempfile.mkdtemp(dir=BENCHMARK_DIR)
+    vba_pipeline.job_queue.store = DiskCache(os.path.join(directory, "jobs.sqlite3"), max_bytes=None, max_age=None)
+    vba_pipeline.llm_cache = DiskCache(os.path.join(directory, "llm_responses.sqlite3"), max_bytes=None, max_age=None)
+    vba_pipeline.revision_cache = DiskCache(os.path.join(directory, "revisions.sqlite3"), max_bytes=None, max_age=None)
+    vba_pipeline.layout_cache = DiskCache(os.path.join(directory, "layouts.sqlite3"), max_bytes=None, max_age=None)
+    vba_pipeline.corpus_index = CorpusIndex(os.path.join(directory, "corpus.sqlite3"))
+
+def extract_modules(paths):
+    modules = []
+    for path in paths:
+        modules.extend(vba_pipeline.parse_vba_modules(vba_pipeline.VBA_Parser(path)) or [])
+    return modules
+
+def build_prompts(vba_code, vba_modules):
+    # Mirrors run_prompt: static pre-filtering, chunking and template formatting, without the LLM call
+    prompts = 0
+    for analysis, template in vba_pipeline.ANALYSIS_PROMPTS.items():
+        for chunk in vba_pipeline.analysis_chunks(vba_code, vba_modules, analysis):
+            vba_pipeline.PromptTemplate(template=template).format(question=chunk)
+            prompts += 1
+    procedures = vba_pipeline.get_procedure_index(vba_modules)['procedures']
+    for batch in vba_pipeline.documentation_batches([procedure for procedure in procedures if procedure['module_type'] == 'bas']):
+        if len(batch) == 1:
+            template, question = vba_pipeline.PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION, batch[0]['code']
+        else:
+            template, question = vba_pipeline.PROMPT_TEMPLATE_DOCUMENTATION_BATCH, vba_pipeline.batch_input(batch)
+        vba_pipeline.PromptTemplate(template=template).format(question=question)
+        prompts += 1
+    return prompts
+
+def sample_documentation(vba_modules, fake_llm):
+    sections = []
+    for procedure in build_index(vba_modules)['procedures']:
+        words = fake_llm.response_words(procedure['code'])
+        sections.append(f"~ {procedure['key']}  Functional Logic: {' '.join(words[:20])}  - {' '.join(words[20:40])}")
+    return "  ".join(sections)
+
+def define_stages(paths, fake_llm, include_llm, workbooks=False):
+    # (name, unit, setup, run): setup is untimed and returns the run's arguments; run returns the item count.
+    # Synthetic projects are plain-text .bas files, so their extraction stage excludes OLE/ZIP container
+    # parsing and is named bas_extraction; olevba_extraction is only reported for real workbooks.
+    context = {}
+
+    def extraction_setup():
+        return (paths,)
+
+    def extraction_run(paths):
+        context['modules'] = extract_modules(paths)
+        context['code'] = vba_pipeline.join_bas_modules(context['modules'])
+        context['lines'] = sum(code.count('\n') + 1 for _, _, code in context['modules'])
+        return context['lines']
+
+    def cold(*arguments):
+        def setup():
+            reset_pipeline_state()
+            return tuple(context[argument] for argument in arguments)
+        return setup
+
+    def warm_index(*arguments):
+        def setup():
+            reset_pipeline_state()
+            vba_pipeline.get_procedure_index(context['modules'])
+            return tuple(context[argument] for argument in arguments)
+        return setup
+
+    def format_setup():
+        if 'documentation' not in context:
+            context['documentation'] = sample_documentation(context['modules'], fake_llm)
+        return (context['documentation'],)
+
+    def llm_run(function):
+        def run(*arguments):
+            fake_llm.reset()
+            function(*arguments)
+            return len(fake_llm.request_latencies)
+        return run
+
+    def per_line(function):
+        def run(*arguments):
+            function(*arguments)
+            return context['lines']
+        return run
+
+    def format_run(documentation):
+        vba_pipeline.format_vba_content(documentation)
+        return len(documentation)
+
+    stages = [
+        ('olevba_extraction' if workbooks else 'bas_extraction', 'lines', extraction_setup, extraction_run),
+        ('procedure_index', 'lines', cold('modules'), per_line(build_index)),
+        ('extract_nodes_and_links', 'lines', cold('modules'), per_line(vba_pipeline.extract_nodes_and_links)),
+        ('check_vba_security', 'lines', cold('modules'), per_line(vba_pipeline.check_vba_security)),
+        ('static_analysis', 'lines', warm_index('modules'),
+         per_line(lambda modules: lint_index(vba_pipeline.get_procedure_index(modules)))),
+        ('prompt_building', 'prompts', warm_index('code', 'modules'), build_prompts),
+        ('format_vba_content', 'chars', format_setup, format_run)
+    ]
+    if include_llm:
+        stages += [
+            ('llm_analyses', 'requests', cold('code', 'modules'), llm_run(vba_pipeline.run_analyses)),
+            ('llm_documentation', 'requests', cold('modules'),
+             llm_run(lambda modules: vba_pipeline.document_procedures(modules, "benchmark")))
+        ]
+    return stages
+
+def run_stage(name, setup, run, repeat):
+    durations = []
+    items = 0
+    for _ in range(repeat):
+        arguments = setup()
+        started = time.perf_counter()
+        items = run(*arguments)
+        durations.append(time.perf_counter() - started)
+
+    # Peak memory is measured in a separate run because tracing slows allocation-heavy code down
+    arguments = setup()
+    tracemalloc.start()
+    try:
+        run(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    summary = summarize(durations, items)
+    summary['items'] = items
+    summary['peak_memory_mib'] = peak / (1024 * 1024)
+    return summary
+
+def print_report(parameters, project_stats, results):
+    print(f"Project: {project_stats['modules']} modules, {project_stats['procedures']} procedures, "
+          f"{project_stats['lines']} lines ({project_stats['bytes'] / 1024:.0f} KiB); parameters: {parameters}")
+    header = f"{'stage':<26}{'runs':>5}{'mean ms':>11}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'throughput':>22}{'peak MiB':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        throughput = f"{result['throughput']:,.0f} {result['unit']}/s"
+        print(f"{name:<26}{result['runs']:>5}{result['mean_ms']:>11.1f}{result['p50_ms']:>11.1f}"
+              f"{result['p90_ms']:>11.1f}{result['p99_ms']:>11.1f}{throughput:>22}{result['peak_memory_mib']:>10.1f}")
+        if 'request_latency' in result:
+            latency = result['request_latency']
+            print(f"{'':<26}LLM requests: {result['items']}, latency p50 {latency['p50_ms']:.0f} ms, "
+                  f"p90 {latency['p90_ms']:.0f} ms, p99 {latency['p99_ms']:.0f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VBA pipeline on synthetic projects with a fake LLM.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Preset project size")
+    parser.add_argument('--modules', type=int, help="Modules in the project (overrides the preset)")
+    parser.add_argument('--procedures', type=int, help="Procedures per module (overrides the preset)")
+    parser.add_argument('--lines', type=int, help="Lines per procedure (overrides the preset)")
+    parser.add_argument('--call-density', type=int, help="Calls per procedure (overrides the preset)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic project")
+    parser.add_argument('--workbook', nargs='*', default=[], help="Benchmark these workbooks instead of a synthetic project")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per stage")
+    parser.add_argument('--skip-llm', action='store_true', help="Skip the LLM stages")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Fake LLM latency per request in seconds")
+    parser.add_argument('--llm-response-tokens', type=int, default=200, help="Fake LLM response length in tokens")
+    parser.add_argument('--llm-seconds-per-token', type=float, default=0.0, help="Fake LLM generation time per token")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Concurrent LLM requests allowed by the scheduler")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    parameters = dict(SCALES[args.scale])
+    for name in parameters:
+        if getattr(args, name) is not None:
+            parameters[name] = getattr(args, name)
+    parameters['seed'] = args.seed
+
+    fake_llm = FakeChatModel(args.llm_latency, args.llm_response_tokens, args.llm_seconds_per_token)
+    vba_pipeline.llm_scheduler.client = fake_llm
+    vba_pipeline.llm_scheduler.requests_per_minute = None
+    vba_pipeline.llm_scheduler.tokens_per_minute = None
+    vba_pipeline.llm_scheduler.max_concurrency = args.llm_concurrency
+
+    try:
+        if args.workbook:
+            paths = args.workbook
+        else:
+            project = generate_project(
+                parameters['modules'], parameters['procedures'], parameters['lines'], parameters['call_density'], args.seed
+            )
+            paths = write_project(project, os.path.join(BENCHMARK_DIR, "project"))
+
+        results = {}
+        for name, unit, setup, run in define_stages(paths, fake_llm, not args.skip_llm, bool(args.workbook)):
+            repeat = 1 if unit == 'requests' else args.repeat
+            result = run_stage(name, setup, run, repeat)
+            result['unit'] = unit
+            if unit == 'requests' and fake_llm.request_latencies:
+                result['request_latency'] = {
+                    f'p{percent}_ms': percentile(fake_llm.request_latencies, percent) * 1000 for percent in PERCENTILES
+                }
+            results[name] = result
+
+        modules = extract_modules(paths)
+        project_stats = {
+            'modules': len(modules),
+            'procedures': len(build_index(modules)['procedures']),
+            'lines': sum(code.count('\n') + 1 for _, _, code in modules),
+            'bytes': sum(len(code) for _, _, code in modules)
+        }
+        print_report(parameters, project_stats, results)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'parameters': parameters, 'project': project_stats, 'stages': results}, f, indent=2)
+    finally:
+        shutil.rmtree(BENCHMARK_DIR, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
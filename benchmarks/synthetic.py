@@ -0,0 +1,88 @@
+import os
+import random
+
+# Synthetic VBA projects: plain-text .bas modules. olevba reads them as text, so timings on them exclude
+# the OLE/ZIP container parsing of a real workbook; benchmark real workbooks with --workbook for that.
+# Every module and procedure is generated from a seeded RNG, so the same parameters always give the same code.
+SCALES = {
+    'small': {'modules': 4, 'procedures': 10, 'lines': 15, 'call_density': 2},
+    'medium': {'modules': 20, 'procedures': 40, 'lines': 30, 'call_density': 3},
+    'large': {'modules': 60, 'procedures': 80, 'lines': 60, 'call_density': 4}
+}
+
+BODY_TEMPLATES = [
+    "    total = total + Cells(i, {column}).Value",
+    "    Worksheets(\"{sheet}\").Range(\"A{row}\").Value = \"{word}\"",
+    "    If value{index} > {number} Then value{index} = value{index} - {number}",
+    "    message = \"Processed \" & CStr(i) & \" rows\"",
+    "    sql = \"SELECT * FROM {table} WHERE id = \" & value{index}",
+    "    Range(\"{column_letter}{row}\").Select",
+    "    Selection.Copy",
+    "    ' {word} {word} step {number}",
+    "    result = Application.WorksheetFunction.Sum(Range(\"A1:A{row}\"))",
+    "    Set shell = CreateObject(\"WScript.Shell\")",
+    "    Debug.Print \"{word}\", value{index}"
+]
+WORDS = ['invoice', 'customer', 'ledger', 'region', 'summary', 'total', 'report', 'balance']
+SHEETS = ['Data', 'Summary', 'Input', 'Output', 'Lookup']
+TABLES = ['Orders', 'Customers', 'Invoices', 'Payments']
+
+def procedure_name(module_index, procedure_index):
+    return f"Proc{module_index}_{procedure_index}"
+
+def generate_procedure(rng, module_index, procedure_index, modules, procedures, lines, call_density):
+    name = procedure_name(module_index, procedure_index)
+    is_function = procedure_index % 3 == 2
+    kind = 'Function' if is_function else 'Sub'
+    scope = 'Private ' if procedure_index % 5 == 4 else ''
+    body = [
+        f"{scope}{kind} {name}(ByVal value0 As Long, Optional value1 As Long = 0)" + (" As Double" if is_function else ""),
+        "    Dim i As Long, total As Double, message As String, sql As String",
+        "    Dim value2 As Long, value3 As Long, result As Variant, shell As Object",
+        f"    For i = 1 To {rng.randint(5, 500)}"
+    ]
+    for _ in range(max(1, lines - 6)):
+        body.append(rng.choice(BODY_TEMPLATES).format(
+            column=rng.randint(1, 20), sheet=rng.choice(SHEETS), row=rng.randint(1, 1000),
+            word=rng.choice(WORDS), index=rng.randint(0, 3), number=rng.randint(1, 99),
+            table=rng.choice(TABLES), column_letter=chr(ord('A') + rng.randint(0, 25))
+        ))
+    body.append("    Next i")
+
+    # Calls go to random procedures anywhere in the project, qualified when they cross modules
+    for _ in range(call_density):
+        target_module = rng.randrange(modules)
+        target = procedure_name(target_module, rng.randrange(procedures))
+        if target_module != module_index:
+            target = f"Module{target_module}.{target}"
+        body.append(f"    Call {target}(i, total)" if rng.random() < 0.5 else f"    {target} i, total")
+
+    if is_function:
+        body.append(f"    {name} = total")
+    body.append(f"End {kind}")
+    return "\n".join(body)
+
+def generate_module(rng, module_index, modules, procedures, lines, call_density):
+    parts = [f'Attribute VB_Name = "Module{module_index}"', "Option Explicit", ""]
+    for procedure_index in range(procedures):
+        parts.append(generate_procedure(rng, module_index, procedure_index, modules, procedures, lines, call_density))
+        parts.append("")
+    return "\n".join(parts)
+
+def generate_project(modules, procedures, lines, call_density, seed=0):
+    # Returns [(module file name, code)]
+    rng = random.Random(seed)
+    return [
+        (f"Module{module_index}.bas", generate_module(rng, module_index, modules, procedures, lines, call_density))
+        for module_index in range(modules)
+    ]
+
+def write_project(project, directory):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for file_name, code in project:
+        path = os.path.join(directory, file_name)
+        with open(path, 'w', newline='\r\n') as f:
+            f.write(code)
+        paths.append(path)
+    return paths
@@ -0,0 +1,75 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+CACHE_DIR = os.environ.get("VBA_CACHE_DIR", "cache")
+
+
+class DiskCache:
+    # SQLite-backed key/value store with age- and size-based eviction.
+    # Entries are JSON-serialised; least recently accessed entries are evicted first.
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connect(self):
+        # A fresh connection per call keeps the cache safe to share across threads and forked workers
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, created = row
+            if self.max_age is not None and now - created > self.max_age:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return default
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        data = json.dumps(value).encode("utf-8")
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict(conn, now)
+
+    def delete(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self, conn, now):
+        if self.max_age is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+        if self.max_bytes is None:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", stale)
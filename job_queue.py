@@ -0,0 +1,162 @@
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+from llm_scheduler import PRIORITY_INTERACTIVE
+from tracing import count, in_current_span
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+class Job:
+    # One background job: its status, the text it has streamed so far and, once finished, its result.
+    # done() and result() let it stand in for a Future.
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.status = JOB_QUEUED
+        self.pieces = []
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.call = None
+        self._future = Future()
+
+    def text(self):
+        return "".join(self.pieces)
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    def wait(self, timeout=None):
+        # Returns early when the job finishes; True if it has
+        return bool(wait([self._future], timeout).done)
+
+    def collect(self, generator):
+        # Keeps every piece a streaming job yields; the generator's return value is the result
+        while True:
+            try:
+                self.pieces.append(next(generator))
+            except StopIteration as finished:
+                return finished.value
+
+    def finish(self, result=None, error=None):
+        self.finished = time.time()
+        if error is not None:
+            self.status, self.error = JOB_FAILED, error
+            self._future.set_exception(error)
+        else:
+            self.status = JOB_DONE
+            self._future.set_result(result)
+
+class JobQueue:
+    # Background workers for analyses that must outlive the Streamlit run that asked for them, with a
+    # registry keyed by (workbook key, analysis). Submitting a key that is queued, running or done
+    # attaches to the existing job (a queued job moves up to the more urgent priority); failed jobs are
+    # run again. Jobs start in priority order and receive their priority as the last argument. A job
+    # function may be a generator: its pieces are kept so pages can show the output while it is
+    # generated. Finished results are written to the store, so a refresh, another tab or a restarted
+    # server gets them without running the job again.
+
+    def __init__(self, max_workers=4, store=None, namespace="", max_jobs=256):
+        self.max_workers = max_workers
+        self.store = store
+        # Part of every stored key, so results of a different model or prompt set are never reused
+        self.namespace = namespace
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = []
+
+    def store_key(self, key):
+        return hashlib.sha256("\0".join([self.namespace, *map(str, key)]).encode('utf-8')).hexdigest()
+
+    def submit(self, key, function, *args, priority=PRIORITY_INTERACTIVE):
+        with self._condition:
+            job = self._jobs.get(key)
+            if job is not None and job.status != JOB_FAILED:
+                count('attached_jobs')
+                self._jobs.move_to_end(key)
+                if job.status == JOB_QUEUED and priority < job.priority:
+                    # The old heap entry is skipped once the job has started
+                    job.priority = priority
+                    heapq.heappush(self._waiting, (priority, next(self._sequence), job))
+                    self._condition.notify()
+                return job
+
+            job = self._jobs[key] = Job(key, priority)
+            stored = self.store.get(self.store_key(key)) if self.store is not None else None
+            if stored is not None:
+                count('stored_jobs')
+                job.finish(result=stored['result'])
+            else:
+                job.call = in_current_span(lambda: self._run(job, function, args), 'job', analysis=key[-1])
+                heapq.heappush(self._waiting, (priority, next(self._sequence), job))
+                self._start_workers()
+                self._condition.notify()
+            self._evict()
+            return job
+
+    def get(self, key):
+        with self._condition:
+            return self._jobs.get(key)
+
+    def clear(self):
+        # Forgets finished jobs; queued and running ones are kept
+        with self._condition:
+            for key, job in list(self._jobs.items()):
+                if job.done():
+                    del self._jobs[key]
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"job-worker-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _evict(self):
+        # Least recently used finished jobs are dropped first; stored results stay available
+        for key in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[key].done():
+                del self._jobs[key]
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._waiting or self._waiting[0][2].status != JOB_QUEUED:
+                    if self._waiting:
+                        heapq.heappop(self._waiting)
+                    else:
+                        self._condition.wait()
+                _, _, job = heapq.heappop(self._waiting)
+                job.status = JOB_RUNNING
+                job.started = time.time()
+            job.call()
+
+    def _run(self, job, function, args):
+        try:
+            result = function(*args, job.priority)
+            if isinstance(result, types.GeneratorType):
+                result = job.collect(result)
+            if self.store is not None:
+                self.store.set(self.store_key(job.key), {'result': result})
+        except Exception as error:
+            job.finish(error=error)
+            return
+        job.finish(result=result)
@@ -0,0 +1,230 @@
+import atexit
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+
+# Every backend returns a client with invoke(prompt) and stream(prompt), whose results carry the
+# text in .content (the LangChain chat model interface the scheduler relies on)
+LLM_BACKENDS = ('groq', 'openai', 'llamacpp')
+DEFAULT_MODELS = {
+    'groq': "mixtral-8x7b-32768",
+    'openai': "local-model",
+    'llamacpp': None
+}
+
+Message = namedtuple('Message', ['content'])
+
+class BackendHTTPError(Exception):
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class OpenAICompatibleClient:
+    # Minimal chat-completions client for OpenAI-compatible servers (llama.cpp server, vLLM, Ollama,
+    # LM Studio, ...). Uses only the standard library so it works in air-gapped installs.
+
+    def __init__(self, base_url, model, temperature=0, api_key=None, timeout=600, before_request=None, max_tokens=None):
+        self.url = base_url.rstrip('/') + '/chat/completions'
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.api_key = api_key
+        self.timeout = timeout
+        self.before_request = before_request
+        self._warm_up_lock = threading.Lock()
+        self._warm_up_started = False
+
+    def _payload(self, prompt, **options):
+        payload = {
+            'model': self.model,
+            'temperature': self.temperature,
+            'messages': [{'role': 'user', 'content': prompt}]
+        }
+        if self.max_tokens is not None:
+            payload['max_tokens'] = self.max_tokens
+        payload.update(options)
+        return payload
+
+    def _request(self, payload):
+        if self.before_request is not None:
+            self.before_request()
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'), headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as error:
+            raise BackendHTTPError(error.code, error.read(500).decode('utf-8', 'replace'), dict(error.headers)) from error
+        except urllib.error.URLError as error:
+            raise ConnectionError(f"Cannot reach {self.url}: {error.reason}") from error
+
+    def invoke(self, prompt):
+        with self._request(self._payload(prompt)) as response:
+            data = json.load(response)
+        return Message(data['choices'][0]['message']['content'] or "")
+
+    def stream(self, prompt):
+        # Server-sent events: one "data: {...}" line per generated piece, terminated by "data: [DONE]"
+        with self._request(self._payload(prompt, stream=True)) as response:
+            for line in response:
+                line = line.decode('utf-8').strip()
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield Message(content)
+
+    def warm_up(self):
+        # Sends a one-token request in the background so the model is loaded before the first analysis;
+        # errors are left to surface on the first real request
+        with self._warm_up_lock:
+            if self._warm_up_started:
+                return
+            self._warm_up_started = True
+
+        def run():
+            try:
+                with self._request(self._payload("Hello", max_tokens=1)):
+                    pass
+            except Exception:
+                pass
+        threading.Thread(target=run, daemon=True).start()
+
+class LlamaCppServer:
+    # Runs llama.cpp's llama-server for a GGUF model. The process is started on first use and shared by
+    # every session of this Python process; a server already answering on the port (left running by an
+    # operator or another process) is reused instead of starting a second copy.
+
+    def __init__(self, model_path, binary="llama-server", host="127.0.0.1", port=8080, context_size=8192,
+                 threads=None, parallel=1, startup_timeout=600):
+        self.model_path = model_path
+        self.binary = binary
+        self.host = host
+        self.port = port
+        self.context_size = context_size
+        self.threads = threads
+        self.parallel = parallel
+        self.startup_timeout = startup_timeout
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started = False
+        self._error = None
+        self._process = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def is_healthy(self):
+        # llama-server answers /health with 503 while the model is still loading
+        try:
+            with urllib.request.urlopen(f"http://{self.host}:{self.port}/health", timeout=2) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def _start(self):
+        try:
+            if self.is_healthy():
+                return
+            command = [
+                self.binary, '-m', self.model_path, '--host', self.host, '--port', str(self.port),
+                '-c', str(self.context_size), '-np', str(self.parallel)
+            ]
+            if self.threads:
+                command += ['-t', str(self.threads)]
+            self._process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            atexit.register(self.stop)
+
+            deadline = time.monotonic() + self.startup_timeout
+            while not self.is_healthy():
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"llama-server exited with code {self._process.returncode} while loading {self.model_path}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"llama-server did not load {self.model_path} within {self.startup_timeout}s")
+                time.sleep(0.5)
+        except Exception as error:
+            self._error = error
+        finally:
+            self._ready.set()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._start, daemon=True).start()
+
+    def wait_ready(self):
+        self.ensure_started()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+def context_size(backend):
+    # Tokens one request may use, prompt and completion together: the context llama-server is started
+    # with, or VBA_LLM_CONTEXT for other backends (None when it is not set)
+    if backend == 'llamacpp':
+        return int(os.environ.get("VBA_LLAMACPP_CONTEXT", 8192))
+    value = os.environ.get("VBA_LLM_CONTEXT")
+    return int(value) if value else None
+
+def create_llm_client(backend, model, temperature, max_tokens=None):
+    if backend == 'groq':
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            temperature=temperature,
+            model=model,
+            max_tokens=max_tokens,
+            api_key=os.environ.get("GROQ_API_KEY", "gsk_***"),  # Replace with your actual API key
+            base_url=os.environ.get("VBA_LLM_BASE_URL")  # e.g. a local fake server for load testing
+        )
+
+    if backend == 'openai':
+        return OpenAICompatibleClient(
+            os.environ.get("VBA_LLM_BASE_URL", "http://127.0.0.1:8080/v1"),
+            model,
+            temperature,
+            api_key=os.environ.get("VBA_LLM_API_KEY"),
+            max_tokens=max_tokens
+        )
+
+    if backend == 'llamacpp':
+        if not model:
+            raise ValueError("Set VBA_LLM_MODEL to the path of a GGUF model to use the llamacpp backend")
+        threads = os.environ.get("VBA_LLAMACPP_THREADS")
+        server = LlamaCppServer(
+            model,
+            binary=os.environ.get("VBA_LLAMACPP_BINARY", "llama-server"),
+            port=int(os.environ.get("VBA_LLAMACPP_PORT", 8080)),
+            context_size=context_size(backend),
+            threads=int(threads) if threads else None
+        )
+        return OpenAICompatibleClient(
+            server.base_url,
+            os.path.basename(model),
+            temperature,
+            before_request=server.wait_ready,
+            max_tokens=max_tokens
+        )
+
+    raise ValueError(f"Unknown LLM backend '{backend}', expected one of {', '.join(LLM_BACKENDS)}")
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from tracing import accumulate, annotate, count, span, stream_span
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BATCH = 2
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError'}
+RATE_WINDOW = 60.0
+
+def status_code(error):
+    code = getattr(error, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return code
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return status_code(error) in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+def retry_after(error):
+    # Seconds the provider asked us to wait, if it sent a Retry-After header
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class LLMScheduler:
+    # Admission control in front of a chat model client (anything with invoke()/stream() returning
+    # chunks with .content). Requests run in the calling thread once they hold a slot: slots are
+    # granted in priority order, within a concurrency limit and sliding one-minute request and token
+    # budgets (None disables a budget, e.g. for local models). Identical prompts already in flight
+    # share one request, and retryable failures (429s, 5xx, timeouts) are retried with jittered
+    # exponential backoff.
+
+    def __init__(self, client, requests_per_minute=30, tokens_per_minute=5000, max_concurrency=4,
+                 max_retries=5, base_delay=1.0, max_delay=60.0, chars_per_token=4, completion_tokens=1024):
+        self.client = client
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.chars_per_token = chars_per_token
+        self.completion_tokens = completion_tokens
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._window = deque()
+        self._in_flight = {}
+
+    def estimate_tokens(self, prompt):
+        # Providers count prompt and completion tokens against the budget
+        return len(prompt) // self.chars_per_token + self.completion_tokens
+
+    def invoke(self, prompt, priority=PRIORITY_INTERACTIVE):
+        with span('llm.invoke', **self._span_attributes(prompt, priority)):
+            return self._invoke(prompt, priority)
+
+    def stream(self, prompt, priority=PRIORITY_INTERACTIVE):
+        return stream_span('llm.stream', self._stream(prompt, priority), **self._span_attributes(prompt, priority))
+
+    def _span_attributes(self, prompt, priority):
+        # Token counts are estimated until the client reports its usage
+        return {'priority': priority, 'prompt_tokens': len(prompt) // self.chars_per_token, 'tokens_estimated': True}
+
+    def _record_usage(self, usage, response):
+        if usage:
+            annotate(prompt_tokens=usage['input_tokens'], completion_tokens=usage['output_tokens'], tokens_estimated=False)
+        else:
+            annotate(completion_tokens=len(response) // self.chars_per_token)
+
+    def _invoke(self, prompt, priority):
+        future, owner = self._claim(prompt)
+        if not owner:
+            annotate(coalesced=True)
+            return future.result()
+
+        try:
+            for attempt in itertools.count():
+                with accumulate('queue_wait'):
+                    self._acquire(self.estimate_tokens(prompt), priority)
+                try:
+                    message = self.client.invoke(prompt)
+                    response = message.content
+                    break
+                except Exception as error:
+                    if attempt >= self.max_retries or not is_retryable(error):
+                        raise
+                    delay = self._backoff(attempt, error)
+                finally:
+                    self._release()
+                count('retries')
+                with accumulate('backoff'):
+                    time.sleep(delay)
+        except BaseException as error:
+            self._finish(prompt, future, error=error)
+            raise
+        self._record_usage(getattr(message, 'usage_metadata', None), response)
+        self._finish(prompt, future, result=response)
+        return response
+
+    def _stream(self, prompt, priority):
+        # Yields response pieces; a failed stream is only retried if nothing has been yielded yet
+        future, owner = self._claim(prompt)
+        if not owner:
+            annotate(coalesced=True)
+            yield future.result()
+            return
+
+        pieces = []
+        usage = None
+        try:
+            for attempt in itertools.count():
+                with accumulate('queue_wait'):
+                    self._acquire(self.estimate_tokens(prompt), priority)
+                started = time.perf_counter()
+                try:
+                    for chunk in self.client.stream(prompt):
+                        if not pieces:
+                            annotate(first_token_ms=(time.perf_counter() - started) * 1000)
+                        usage = getattr(chunk, 'usage_metadata', None) or usage
+                        pieces.append(chunk.content)
+                        yield chunk.content
+                    break
+                except Exception as error:
+                    if pieces or attempt >= self.max_retries or not is_retryable(error):
+                        raise
+                    delay = self._backoff(attempt, error)
+                finally:
+                    self._release()
+                count('retries')
+                with accumulate('backoff'):
+                    time.sleep(delay)
+        except BaseException as error:
+            if isinstance(error, GeneratorExit):
+                error = RuntimeError("LLM stream was closed before it finished")
+            self._finish(prompt, future, error=error)
+            raise
+        response = "".join(pieces)
+        self._record_usage(usage, response)
+        self._finish(prompt, future, result=response)
+
+    def _claim(self, prompt):
+        with self._condition:
+            future = self._in_flight.get(prompt)
+            if future is not None:
+                return future, False
+            future = self._in_flight[prompt] = Future()
+            return future, True
+
+    def _finish(self, prompt, future, result=None, error=None):
+        with self._condition:
+            self._in_flight.pop(prompt, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _backoff(self, attempt, error):
+        requested = retry_after(error)
+        if requested is not None:
+            return requested
+        # Equal jitter: half of the exponential delay is fixed, the other half random
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _budget_delay(self, tokens):
+        now = time.monotonic()
+        while self._window and now - self._window[0][0] >= RATE_WINDOW:
+            self._window.popleft()
+        if not self._window:
+            return 0
+
+        delay = 0
+        if self.requests_per_minute is not None and len(self._window) >= self.requests_per_minute:
+            delay = self._window[0][0] + RATE_WINDOW - now
+        if self.tokens_per_minute is None:
+            return delay
+        used = sum(entry_tokens for _, entry_tokens in self._window)
+        # Wait until enough of the window has expired for this request's tokens to fit
+        for started, entry_tokens in self._window:
+            if used + tokens <= self.tokens_per_minute:
+                break
+            used -= entry_tokens
+            delay = max(delay, started + RATE_WINDOW - now)
+        return delay
+
+    def _acquire(self, tokens, priority):
+        if self.tokens_per_minute is not None and tokens > self.tokens_per_minute:
+            # Waiting would not help: the provider rejects such a request however empty the window is
+            raise ValueError(
+                f"LLM request needs about {tokens} tokens, more than the budget of {self.tokens_per_minute} tokens per minute"
+            )
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket and self._active < self.max_concurrency:
+                        delay = self._budget_delay(tokens)
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._window.append((time.monotonic(), tokens))
+            self._condition.notify_all()
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
@@ -0,0 +1,280 @@
+import threading
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+import llm_scheduler
+from llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, LLMScheduler
+
+Message = namedtuple('Message', ['content'])
+
+class ProviderError(Exception):
+    # Shaped like the errors of the provider clients: a status code and the response headers
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeClient:
+    # Scripted stand-in for the chat model: each call takes the next outcome (an exception to raise or
+    # a response text) and falls back to echoing the prompt once the script is used up. Prompts listed
+    # in hold block until release() so tests can control what is in flight.
+
+    def __init__(self, outcomes=(), hold=()):
+        self.outcomes = list(outcomes)
+        self.hold = set(hold)
+        self.prompts = []
+        self.started = threading.Event()
+        self._released = threading.Event()
+        self._lock = threading.Lock()
+
+    def release(self):
+        self._released.set()
+
+    def _next(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+            outcome = self.outcomes.pop(0) if self.outcomes else f"answer to {prompt}"
+        if prompt in self.hold:
+            self.started.set()
+            self._released.wait(5)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def invoke(self, prompt):
+        return Message(self._next(prompt))
+
+    def stream(self, prompt):
+        outcome = self._next(prompt)
+        for piece in outcome if isinstance(outcome, list) else [outcome]:
+            if isinstance(piece, Exception):
+                raise piece
+            yield Message(piece)
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+def record_claims(scheduler):
+    # Prompts whose request has been started or joined, so a test knows when every caller is waiting
+    claims = []
+    claim = scheduler._claim
+    def recording_claim(prompt):
+        claimed = claim(prompt)
+        claims.append(prompt)
+        return claimed
+    scheduler._claim = recording_claim
+    return claims
+
+class BudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(llm_scheduler.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_budget_waits_until_enough_tokens_expire(self):
+        scheduler = LLMScheduler(FakeClient(), requests_per_minute=None, tokens_per_minute=1000)
+        scheduler._acquire(600, PRIORITY_INTERACTIVE)
+        scheduler._release()
+        self.assertEqual(scheduler._budget_delay(300), 0)
+        self.assertEqual(scheduler._budget_delay(600), 60.0)
+        self.now += 45
+        self.assertEqual(scheduler._budget_delay(600), 15.0)
+        self.now += 15
+        self.assertEqual(scheduler._budget_delay(600), 0)
+
+    def test_request_budget_waits_for_the_oldest_request(self):
+        scheduler = LLMScheduler(FakeClient(), requests_per_minute=2, tokens_per_minute=None)
+        scheduler._acquire(1, PRIORITY_INTERACTIVE)
+        self.now += 10
+        scheduler._acquire(1, PRIORITY_INTERACTIVE)
+        self.assertEqual(scheduler._budget_delay(1), 50.0)
+        self.now += 50
+        self.assertEqual(scheduler._budget_delay(1), 0)
+
+    def test_request_larger_than_the_token_budget_is_rejected(self):
+        client = FakeClient()
+        scheduler = LLMScheduler(client, tokens_per_minute=1000, completion_tokens=100)
+        with self.assertRaises(ValueError):
+            scheduler.invoke("x" * 4000)
+        self.assertEqual(client.prompts, [])
+        self.assertEqual(scheduler._in_flight, {})
+
+    def test_no_budget_admits_immediately(self):
+        scheduler = LLMScheduler(FakeClient(), requests_per_minute=None, tokens_per_minute=None)
+        for _ in range(100):
+            scheduler._acquire(10 ** 6, PRIORITY_INTERACTIVE)
+            scheduler._release()
+        self.assertEqual(scheduler._budget_delay(10 ** 6), 0)
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        sleep = mock.patch.object(llm_scheduler.time, 'sleep', self.sleeps.append)
+        # Jitter always picks the top of its range, so the delays are exact
+        uniform = mock.patch.object(llm_scheduler.random, 'uniform', lambda low, high: high)
+        sleep.start()
+        uniform.start()
+        self.addCleanup(sleep.stop)
+        self.addCleanup(uniform.stop)
+
+    def scheduler(self, client, **options):
+        return LLMScheduler(client, requests_per_minute=None, tokens_per_minute=None, base_delay=1.0, **options)
+
+    def test_retryable_errors_are_retried_with_exponential_backoff(self):
+        client = FakeClient([ProviderError(429), ProviderError(503), "done"])
+        self.assertEqual(self.scheduler(client).invoke("prompt"), "done")
+        self.assertEqual(len(client.prompts), 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_retry_after_header_sets_the_delay(self):
+        client = FakeClient([ProviderError(429, {'retry-after': '7'}), "done"])
+        self.assertEqual(self.scheduler(client).invoke("prompt"), "done")
+        self.assertEqual(self.sleeps, [7.0])
+
+    def test_connection_errors_are_retried(self):
+        client = FakeClient([ConnectionError("reset"), "done"])
+        self.assertEqual(self.scheduler(client).invoke("prompt"), "done")
+        self.assertEqual(len(client.prompts), 2)
+
+    def test_other_errors_are_raised_at_once(self):
+        client = FakeClient([ProviderError(400)])
+        with self.assertRaises(ProviderError):
+            self.scheduler(client).invoke("prompt")
+        self.assertEqual(len(client.prompts), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_gives_up_after_max_retries(self):
+        client = FakeClient([ProviderError(500)] * 3)
+        with self.assertRaises(ProviderError):
+            self.scheduler(client, max_retries=2).invoke("prompt")
+        self.assertEqual(len(client.prompts), 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_backoff_is_capped(self):
+        scheduler = self.scheduler(FakeClient(), max_delay=5.0)
+        self.assertEqual(scheduler._backoff(10, ProviderError(503)), 5.0)
+
+    def test_stream_is_retried_before_its_first_piece(self):
+        client = FakeClient([ProviderError(429), ["a", "b"]])
+        self.assertEqual(list(self.scheduler(client).stream("prompt")), ["a", "b"])
+        self.assertEqual(len(client.prompts), 2)
+
+    def test_stream_is_not_retried_after_its_first_piece(self):
+        client = FakeClient([["a", ProviderError(503)]])
+        pieces = []
+        with self.assertRaises(ProviderError):
+            for piece in self.scheduler(client).stream("prompt"):
+                pieces.append(piece)
+        self.assertEqual(pieces, ["a"])
+        self.assertEqual(len(client.prompts), 1)
+
+class CoalescingTest(unittest.TestCase):
+
+    def test_identical_prompts_in_flight_share_one_request(self):
+        client = FakeClient(hold={"prompt"})
+        scheduler = LLMScheduler(client, requests_per_minute=None, tokens_per_minute=None)
+        claims = record_claims(scheduler)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(scheduler.invoke("prompt"))) for _ in range(3)]
+        threads[0].start()
+        client.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        wait_until(lambda: len(claims) == 3)
+        client.release()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(client.prompts, ["prompt"])
+        self.assertEqual(results, ["answer to prompt"] * 3)
+        self.assertEqual(scheduler._in_flight, {})
+
+    def test_prompt_is_sent_again_once_finished(self):
+        client = FakeClient()
+        scheduler = LLMScheduler(client, requests_per_minute=None, tokens_per_minute=None)
+        scheduler.invoke("prompt")
+        scheduler.invoke("prompt")
+        self.assertEqual(client.prompts, ["prompt", "prompt"])
+
+    def test_failure_is_shared_with_waiting_requests(self):
+        client = FakeClient([ProviderError(400)], hold={"prompt"})
+        scheduler = LLMScheduler(client, requests_per_minute=None, tokens_per_minute=None)
+        claims = record_claims(scheduler)
+
+        errors = []
+        def invoke():
+            try:
+                scheduler.invoke("prompt")
+            except ProviderError as error:
+                errors.append(error)
+        threads = [threading.Thread(target=invoke) for _ in range(2)]
+        threads[0].start()
+        client.started.wait(5)
+        threads[1].start()
+        wait_until(lambda: len(claims) == 2)
+        client.release()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(len(client.prompts), 1)
+
+class PriorityTest(unittest.TestCase):
+
+    def test_interactive_requests_are_served_before_prefetches(self):
+        client = FakeClient(hold={"running"})
+        scheduler = LLMScheduler(client, requests_per_minute=None, tokens_per_minute=None, max_concurrency=1)
+        running = threading.Thread(target=scheduler.invoke, args=("running",))
+        running.start()
+        client.started.wait(5)
+
+        waiting = []
+        for prompt, priority in (("prefetch 1", PRIORITY_PREFETCH), ("prefetch 2", PRIORITY_PREFETCH), ("interactive", PRIORITY_INTERACTIVE)):
+            thread = threading.Thread(target=scheduler.invoke, args=(prompt, priority))
+            thread.start()
+            waiting.append(thread)
+            # Queue them one at a time so arrival order is known
+            wait_until(lambda: len(scheduler._waiting) == len(waiting))
+        client.release()
+        for thread in [running] + waiting:
+            thread.join(5)
+
+        self.assertEqual(client.prompts, ["running", "interactive", "prefetch 1", "prefetch 2"])
+
+    def test_concurrency_limit_is_respected(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        class CountingClient(FakeClient):
+            def invoke(self, prompt):
+                with lock:
+                    active.append(prompt)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.remove(prompt)
+                return Message(prompt)
+
+        scheduler = LLMScheduler(CountingClient(), requests_per_minute=None, tokens_per_minute=None, max_concurrency=2)
+        threads = [threading.Thread(target=scheduler.invoke, args=(f"prompt {index}",)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(len(peak), 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Timing spans for the pipeline stages. The current span lives in a context variable, so nested
+# stages become child spans; work handed to a thread pool keeps its parent through in_current_span.
+# Finished spans go to every exporter: the in-memory recorder behind the diagnostics panel, plus
+# a JSON lines file (VBA_TRACE_FILE) and an OTLP/HTTP collector (VBA_OTLP_ENDPOINT) when configured.
+TRACE_FILE = os.environ.get("VBA_TRACE_FILE")
+OTLP_ENDPOINT = os.environ.get("VBA_OTLP_ENDPOINT")
+SERVICE_NAME = os.environ.get("VBA_SERVICE_NAME", "vba-macro-documentation")
+
+MAX_RECORDED_TRACES = 64
+MAX_SPANS_PER_TRACE = 2000
+OTLP_BATCH_SIZE = 256
+OTLP_FLUSH_INTERVAL = 5.0
+
+current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    # One timed stage. Attributes hold what the stage processed (bytes, tokens, cache hits, ...);
+    # counters that several calls contribute to are accumulated with add().
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, amount=1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        for exporter in exporters:
+            exporter.export(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_ns / 1e9,
+            'duration_ms': self.duration * 1000,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, current_span.get(), attributes)
+    token = current_span.set(current)
+    try:
+        yield current
+    except Exception as error:
+        current.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        current_span.reset(token)
+        current.finish()
+
+def stream_span(name, generator, **attributes):
+    # Span around a generator. It is the current span only while the generator runs, not while the
+    # caller handles what was yielded; the generator's return value is passed through.
+    current = Span(name, current_span.get(), attributes)
+    try:
+        while True:
+            token = current_span.set(current)
+            try:
+                piece = next(generator)
+            except StopIteration as finished:
+                return finished.value
+            finally:
+                current_span.reset(token)
+            yield piece
+    except GeneratorExit:
+        current.set(interrupted=True)
+        generator.close()
+        raise
+    except Exception as error:
+        current.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        current.finish()
+
+def in_current_span(function, name=None, **attributes):
+    # Runs function, typically in a pool thread, as part of the caller's trace; with a name, in its
+    # own span that also records how long the call waited in the pool's queue
+    parent = current_span.get()
+    submitted = time.perf_counter()
+
+    def run(*args, **kwargs):
+        token = current_span.set(parent)
+        try:
+            if name is None:
+                return function(*args, **kwargs)
+            with span(name, queue_wait_ms=(time.perf_counter() - submitted) * 1000, **attributes):
+                return function(*args, **kwargs)
+        finally:
+            current_span.reset(token)
+    return run
+
+def annotate(**attributes):
+    current = current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def count(name, amount=1):
+    current = current_span.get()
+    if current is not None:
+        current.add(name, amount)
+
+@contextmanager
+def accumulate(name):
+    # Adds the block's duration to the current span's '<name>_ms' counter instead of opening a span
+    # per call, for steps that run many times per stage (e.g. re-rendering a streamed response)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        count(f"{name}_ms", (time.perf_counter() - started) * 1000)
+        count(f"{name}_calls")
+
+class TraceRecorder:
+    # Keeps the spans of the most recent traces in memory for the diagnostics panel
+
+    def __init__(self, max_traces=MAX_RECORDED_TRACES, max_spans=MAX_SPANS_PER_TRACE):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, finished):
+        with self._lock:
+            spans = self._traces.get(finished.trace_id)
+            if spans is None:
+                spans = self._traces[finished.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(spans) < self.max_spans:
+                spans.append(finished)
+
+    def traces_for(self, workbook):
+        # Traces whose root span was tagged with the workbook hash, oldest first
+        with self._lock:
+            traces = [list(spans) for spans in self._traces.values()]
+        return [
+            spans for spans in traces
+            if any(recorded.parent_id is None and recorded.attributes.get('workbook') == workbook for recorded in spans)
+        ]
+
+class JsonLinesExporter:
+    # Appends one JSON object per finished span
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, finished):
+        line = json.dumps(finished.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def otlp_span(finished):
+    otlp = {
+        'traceId': finished.trace_id,
+        'spanId': finished.span_id,
+        'name': finished.name,
+        'kind': 1,
+        'startTimeUnixNano': str(finished.start_ns),
+        'endTimeUnixNano': str(finished.end_ns),
+        'attributes': [
+            {'key': key, 'value': otlp_value(value)} for key, value in finished.attributes.items() if value is not None
+        ],
+        'status': {'code': 2, 'message': finished.error} if finished.error else {'code': 1}
+    }
+    if finished.parent_id:
+        otlp['parentSpanId'] = finished.parent_id
+    return otlp
+
+class OTLPExporter:
+    # Sends spans in the OTLP/HTTP JSON encoding to a collector (e.g. http://localhost:4318),
+    # batched by a background thread; batches the collector does not accept are dropped
+
+    def __init__(self, endpoint, service_name=SERVICE_NAME, batch_size=OTLP_BATCH_SIZE,
+                 flush_interval=OTLP_FLUSH_INTERVAL, timeout=10):
+        self.url = endpoint.rstrip('/') + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+        atexit.register(self.flush)
+
+    def export(self, finished):
+        with self._condition:
+            self._pending.append(finished)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size, self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._send_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch):
+        body = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': otlp_value(self.service_name)}]},
+            'scopeSpans': [{'scope': {'name': 'vba_pipeline'}, 'spans': [otlp_span(finished) for finished in batch]}]
+        }]}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except OSError:
+            self.dropped += len(batch)
+
+recorder = TraceRecorder()
+exporters = [recorder]
+if TRACE_FILE:
+    exporters.append(JsonLinesExporter(TRACE_FILE))
+if OTLP_ENDPOINT:
+    exporters.append(OTLPExporter(OTLP_ENDPOINT))
+
+def stage_breakdown(traces):
+    # Latency per stage across the given traces, slowest stages first
+    stages = {}
+    for spans in traces:
+        for recorded in spans:
+            stage = stages.setdefault(recorded.name, {
+                'stage': recorded.name, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'cache_hits': 0, 'tokens': 0, 'bytes': 0, 'errors': 0
+            })
+            attributes = recorded.attributes
+            duration_ms = recorded.duration * 1000
+            stage['calls'] += 1
+            stage['total_ms'] += duration_ms
+            stage['max_ms'] = max(stage['max_ms'], duration_ms)
+            stage['cache_hits'] += int(attributes.get('cache_hit') is True) + attributes.get('llm_cache_hits', 0)
+            stage['tokens'] += attributes.get('prompt_tokens', 0) + attributes.get('completion_tokens', 0)
+            stage['bytes'] += attributes.get('bytes', 0)
+            stage['errors'] += recorded.error is not None
+    rows = sorted(stages.values(), key=lambda stage: -stage['total_ms'])
+    for row in rows:
+        row['mean_ms'] = row['total_ms'] / row['calls']
+    return rows
+
+def format_trace(spans):
+    # Indented span tree of one trace, in start order
+    children = {}
+    for recorded in sorted(spans, key=lambda recorded: recorded.start_ns):
+        children.setdefault(recorded.parent_id, []).append(recorded)
+    span_ids = {recorded.span_id for recorded in spans}
+    # Spans whose parent was not recorded (e.g. trimmed) are shown at the top level
+    roots = [recorded for parent_id, group in children.items() if parent_id not in span_ids for recorded in group]
+
+    lines = []
+    def visit(recorded, depth):
+        details = ", ".join(f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in recorded.attributes.items())
+        status = f"  ERROR {recorded.error}" if recorded.error else ""
+        lines.append(f"{'  ' * depth}{recorded.name}  {recorded.duration * 1000:.1f} ms  {details}{status}")
+        for child in children.get(recorded.span_id, []):
+            visit(child, depth + 1)
+    for root in sorted(roots, key=lambda recorded: recorded.start_ns):
+        visit(root, 0)
+    return "\n".join(lines)
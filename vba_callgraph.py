@@ -0,0 +1,67 @@
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+def node_id(procedure):
+    return f"{procedure['module']}.{procedure['name']}"
+
+def build_call_graph(index):
+    # Symbol tables keyed by lower-case name (VBA is case-insensitive); resolution is a dict lookup per call
+    nodes = {}
+    by_module = {}
+    public_names = {}
+    for procedure in index['procedures']:
+        identifier = node_id(procedure)
+        if identifier not in nodes:
+            nodes[identifier] = {
+                'id': identifier,
+                'module': procedure['module'],
+                'name': procedure['name'],
+                'kind': procedure['kind']
+            }
+        by_module.setdefault(procedure['module'].lower(), {}).setdefault(procedure['name'].lower(), identifier)
+        if procedure['scope'] != 'Private' and procedure['module_type'] == 'bas':
+            public_names.setdefault(procedure['name'].lower(), identifier)
+
+    adjacency = {identifier: [] for identifier in nodes}
+    seen_links = set()
+    for procedure in index['procedures']:
+        source = node_id(procedure)
+        local_names = by_module.get(procedure['module'].lower(), {})
+        for call in procedure['calls']:
+            qualifier, _, name = call.lower().rpartition('.')
+            if qualifier:
+                target = by_module.get(qualifier, {}).get(name)
+            else:
+                target = local_names.get(name) or public_names.get(name)
+            if target is not None and (source, target) not in seen_links:
+                seen_links.add((source, target))
+                adjacency[source].append(target)
+
+    return {'nodes': list(nodes.values()), 'adjacency': adjacency}
+
+def graph_links(graph):
+    return [(source, target) for source, targets in graph['adjacency'].items() for target in targets]
+
+def to_json(graph):
+    return json.dumps({
+        'nodes': graph['nodes'],
+        'links': [{'source': source, 'target': target} for source, target in graph_links(graph)]
+    }, indent=2)
+
+def to_graphml(graph):
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">',
+        '  <key id="module" for="node" attr.name="module" attr.type="string"/>',
+        '  <key id="kind" for="node" attr.name="kind" attr.type="string"/>',
+        '  <graph id="calls" edgedefault="directed">'
+    ]
+    for node in graph['nodes']:
+        lines.append(f"    <node id={quoteattr(node['id'])}>")
+        lines.append(f"      <data key=\"module\">{escape(node['module'])}</data>")
+        lines.append(f"      <data key=\"kind\">{escape(node['kind'])}</data>")
+        lines.append("    </node>")
+    for source, target in graph_links(graph):
+        lines.append(f"    <edge source={quoteattr(source)} target={quoteattr(target)}/>")
+    lines.extend(['  </graph>', '</graphml>'])
+    return "\n".join(lines) + "\n"
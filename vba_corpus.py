@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from contextlib import closing
+
+from cache import CACHE_DIR
+from vba_index import iter_statements, tokenize
+
+# Near duplicates: MinHash over 5-token shingles, split into 16 LSH bands of 4 rows, which makes
+# procedures with a Jaccard similarity of roughly 0.5 or more candidates of each other
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+NEAR_DUPLICATE_THRESHOLD = 0.8
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_MASK = 0xFFFFFFFF
+
+permutation_random = random.Random(1903)
+PERMUTATIONS = [
+    (permutation_random.randrange(1, MERSENNE_PRIME), permutation_random.randrange(MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+def normalize_tokens(code):
+    # Comments and layout are dropped and everything but string literals is lower-cased (VBA is case-insensitive)
+    tokens = []
+    for statement in iter_statements(tokenize(code)):
+        tokens.extend(token.text if token.kind == 'string' else token.text.lower() for token in statement)
+        tokens.append('\n')
+    return tokens
+
+def procedure_fingerprint(tokens):
+    return hashlib.blake2b(" ".join(tokens).encode('utf-8'), digest_size=16).digest()
+
+def minhash_signature(tokens):
+    shingles = {
+        zlib.crc32("\0".join(tokens[index:index + SHINGLE_SIZE]).encode('utf-8'))
+        for index in range(max(1, len(tokens) - SHINGLE_SIZE + 1))
+    }
+    signature = array('I', (
+        min(((a * shingle + b) % MERSENNE_PRIME) & HASH_MASK for shingle in shingles)
+        for a, b in PERMUTATIONS
+    ))
+    return signature.tobytes()
+
+def lsh_buckets(signature):
+    row_bytes = LSH_ROWS * array('I').itemsize
+    return [(band, zlib.crc32(signature[band * row_bytes:(band + 1) * row_bytes])) for band in range(LSH_BANDS)]
+
+def estimate_similarity(signature, other):
+    first, second = array('I', signature), array('I', other)
+    return sum(left == right for left, right in zip(first, second)) / len(first)
+
+def corpus_entries(index):
+    # (procedure key, fingerprint, MinHash signature, token count) for every procedure of a workbook
+    entries = []
+    for procedure in index['procedures']:
+        tokens = normalize_tokens(procedure['code'])
+        entries.append((procedure['key'], procedure_fingerprint(tokens), minhash_signature(tokens), len(tokens)))
+    return entries
+
+class CorpusIndex:
+    # SQLite index of procedure fingerprints across a corpus of workbooks. Each distinct procedure is
+    # stored once (16-byte fingerprint, 256-byte MinHash signature, LSH buckets, documentation);
+    # workbooks only hold references to it. Documentation is kept per namespace (model and prompts),
+    # so text written by another model or prompt set is never served.
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS workbooks ("
+                "id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, hash TEXT NOT NULL, indexed REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS procedures ("
+                "fingerprint BLOB PRIMARY KEY, signature BLOB NOT NULL, tokens INTEGER NOT NULL) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS occurrences ("
+                "workbook INTEGER NOT NULL, fingerprint BLOB NOT NULL, key TEXT NOT NULL, "
+                "PRIMARY KEY (workbook, key)) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS occurrences_fingerprint ON occurrences (fingerprint);"
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "band INTEGER NOT NULL, bucket INTEGER NOT NULL, fingerprint BLOB NOT NULL, "
+                "PRIMARY KEY (band, bucket, fingerprint)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS documentation ("
+                "namespace TEXT NOT NULL, fingerprint BLOB NOT NULL, text TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, fingerprint)) WITHOUT ROWID;"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def is_current(self, path, workbook_hash):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT hash FROM workbooks WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == workbook_hash
+
+    def add_workbook(self, path, workbook_hash, entries):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO workbooks (path, hash, indexed) VALUES (?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET hash = excluded.hash, indexed = excluded.indexed",
+                (path, workbook_hash, time.time())
+            )
+            workbook_id = conn.execute("SELECT id FROM workbooks WHERE path = ?", (path,)).fetchone()[0]
+            conn.execute("DELETE FROM occurrences WHERE workbook = ?", (workbook_id,))
+            for key, fingerprint, signature, token_count in entries:
+                conn.execute("INSERT OR REPLACE INTO occurrences VALUES (?, ?, ?)", (workbook_id, fingerprint, key))
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO procedures VALUES (?, ?, ?)", (fingerprint, signature, token_count)
+                ).rowcount
+                if inserted:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                        [(band, bucket, fingerprint) for band, bucket in lsh_buckets(signature)]
+                    )
+
+    def get_documentation(self, namespace, fingerprint):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT text FROM documentation WHERE namespace = ? AND fingerprint = ?", (namespace, fingerprint)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_documentation(self, namespace, fingerprint, text):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO documentation VALUES (?, ?, ?)", (namespace, fingerprint, text))
+
+    def workbooks_with(self, fingerprint):
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT workbooks.path, occurrences.key FROM occurrences "
+                "JOIN workbooks ON workbooks.id = occurrences.workbook "
+                "WHERE occurrences.fingerprint = ? ORDER BY workbooks.path, occurrences.key",
+                (fingerprint,)
+            ).fetchall()
+
+    def find_fingerprints(self, name):
+        # Procedures whose key ("Module.Name (Kind)") or bare name matches, e.g. "FormatReport" or "Module1.FormatReport";
+        # the name is escaped so "_" and "%" in it are matched literally
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        with closing(self._connect()) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT fingerprint FROM occurrences "
+                "WHERE key = ? OR key LIKE ? ESCAPE '\\' OR key LIKE ? ESCAPE '\\'",
+                (name, f"{escaped} (%", f"%.{escaped} (%")
+            )]
+
+    def near_duplicates(self, fingerprint, signature=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+        with closing(self._connect()) as conn:
+            if signature is None:
+                row = conn.execute("SELECT signature FROM procedures WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                if row is None:
+                    return []
+                signature = row[0]
+            candidates = set()
+            for band, bucket in lsh_buckets(signature):
+                candidates.update(row[0] for row in conn.execute(
+                    "SELECT fingerprint FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                ))
+            candidates.discard(fingerprint)
+            matches = []
+            for candidate in candidates:
+                other = conn.execute("SELECT signature FROM procedures WHERE fingerprint = ?", (candidate,)).fetchone()[0]
+                similarity = estimate_similarity(signature, other)
+                if similarity >= threshold:
+                    matches.append((candidate, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def shared_procedures(self, min_workbooks=2):
+        # Procedures copied into several workbooks, most widely shared first
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT fingerprint, COUNT(DISTINCT workbook) AS copies, MIN(key) FROM occurrences "
+                "GROUP BY fingerprint HAVING copies >= ? ORDER BY copies DESC, MIN(key)",
+                (min_workbooks,)
+            ).fetchall()
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            workbooks = conn.execute("SELECT COUNT(*) FROM workbooks").fetchone()[0]
+            occurrences = conn.execute("SELECT COUNT(*) FROM occurrences").fetchone()[0]
+            unique = conn.execute("SELECT COUNT(*) FROM procedures").fetchone()[0]
+            documented = conn.execute("SELECT COUNT(DISTINCT fingerprint) FROM documentation").fetchone()[0]
+        return {'workbooks': workbooks, 'procedures': occurrences, 'unique_procedures': unique, 'documented': documented}
+
+def print_locations(corpus, fingerprint):
+    for path, key in corpus.workbooks_with(fingerprint):
+        print(f"  {path}: {key}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the corpus index built by batch.py --corpus.")
+    parser.add_argument('--corpus', default=os.path.join(CACHE_DIR, "corpus.sqlite3"),
+                        help="Corpus index file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="Workbook, procedure and unique procedure counts")
+    shared = commands.add_parser('shared', help="Procedures copied into several workbooks")
+    shared.add_argument('--min-workbooks', type=int, default=2)
+    where = commands.add_parser('where', help="Workbooks containing a procedure and its near duplicates")
+    where.add_argument('procedure', help="Procedure name or key, e.g. Module1.FormatReport")
+    where.add_argument('--threshold', type=float, default=NEAR_DUPLICATE_THRESHOLD, help="Minimum estimated similarity")
+    args = parser.parse_args(argv)
+
+    corpus = CorpusIndex(args.corpus)
+    if args.command == 'stats':
+        stats = corpus.stats()
+        print(f"{stats['workbooks']} workbooks, {stats['procedures']} procedures, "
+              f"{stats['unique_procedures']} unique, {stats['documented']} documented")
+    elif args.command == 'shared':
+        for fingerprint, copies, key in corpus.shared_procedures(args.min_workbooks):
+            print(f"{copies:>5} workbooks  {key}  [{fingerprint.hex()}]")
+    else:
+        fingerprints = corpus.find_fingerprints(args.procedure)
+        if not fingerprints:
+            print(f"No procedure matching '{args.procedure}' in the corpus.")
+            return 1
+        for fingerprint in fingerprints:
+            print(f"[{fingerprint.hex()}] identical copies:")
+            print_locations(corpus, fingerprint)
+            for candidate, similarity in corpus.near_duplicates(fingerprint, threshold=args.threshold):
+                if candidate in fingerprints:
+                    continue
+                print(f"  near duplicate ({similarity:.0%} similar) [{candidate.hex()}]:")
+                print_locations(corpus, candidate)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
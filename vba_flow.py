@@ -0,0 +1,293 @@
+import json
+from math import ceil
+
+# Layered layout computed in Python so the browser only draws pre-positioned nodes
+MAX_LAYER_WIDTH = 40
+X_SPACING = 180
+Y_SPACING = 90
+ORDERING_SWEEPS = 4
+
+def remove_cycles(successors):
+    # Iterative DFS; edges pointing back into the current path are dropped to leave a DAG
+    node_count = len(successors)
+    state = [0] * node_count
+    dag = [[] for _ in range(node_count)]
+    for root in range(node_count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, remaining = stack[-1]
+            for target in remaining:
+                if state[target] == 0:
+                    dag[node].append(target)
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+                if state[target] == 2:
+                    dag[node].append(target)
+            else:
+                state[node] = 2
+                stack.pop()
+    return dag
+
+def assign_ranks(dag):
+    # Longest path from the roots, computed over a topological order (Kahn's algorithm)
+    node_count = len(dag)
+    indegree = [0] * node_count
+    for targets in dag:
+        for target in targets:
+            indegree[target] += 1
+    ranks = [0] * node_count
+    queue = [node for node in range(node_count) if indegree[node] == 0]
+    for node in queue:
+        for target in dag[node]:
+            ranks[target] = max(ranks[target], ranks[node] + 1)
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    return ranks
+
+def order_layers(dag, ranks):
+    layers = [[] for _ in range(max(ranks, default=-1) + 1)]
+    for node, rank in enumerate(ranks):
+        layers[rank].append(node)
+
+    predecessors = [[] for _ in range(len(dag))]
+    for node, targets in enumerate(dag):
+        for target in targets:
+            predecessors[target].append(node)
+
+    # Barycenter heuristic: alternate downward and upward sweeps to reduce edge crossings
+    positions = [0] * len(dag)
+    for layer in layers:
+        for position, node in enumerate(layer):
+            positions[node] = position
+    for sweep in range(ORDERING_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbours = predecessors if downward else dag
+        for layer in (layers[1:] if downward else reversed(layers[:-1])):
+            def barycenter(node):
+                adjacent = neighbours[node]
+                if not adjacent:
+                    return positions[node]
+                return sum(positions[other] for other in adjacent) / len(adjacent)
+            layer.sort(key=barycenter)
+            for position, node in enumerate(layer):
+                positions[node] = position
+    return layers
+
+def compute_layout(graph):
+    node_ids = [node['id'] for node in graph['nodes']]
+    node_index = {node_id: index for index, node_id in enumerate(node_ids)}
+    successors = [[node_index[target] for target in graph['adjacency'][node_id]] for node_id in node_ids]
+
+    dag = remove_cycles(successors)
+    layers = order_layers(dag, assign_ranks(dag))
+
+    # Very wide layers wrap onto extra rows so the drawing stays readable
+    coordinates = [None] * len(node_ids)
+    row = 0
+    for layer in layers:
+        width = min(len(layer), MAX_LAYER_WIDTH)
+        for position, node in enumerate(layer):
+            column = position % MAX_LAYER_WIDTH
+            x = (column - (width - 1) / 2) * X_SPACING
+            y = (row + position // MAX_LAYER_WIDTH) * Y_SPACING
+            coordinates[node] = (round(x), round(y))
+        row += max(1, ceil(len(layer) / MAX_LAYER_WIDTH)) + 1
+    return coordinates
+
+def build_flow_payload(graph):
+    # Compact payload: modules are listed once, nodes are [name, module index, x, y] and edges a flat index list
+    modules = sorted({node['module'] for node in graph['nodes']})
+    module_index = {module: index for index, module in enumerate(modules)}
+    node_index = {node['id']: index for index, node in enumerate(graph['nodes'])}
+    coordinates = compute_layout(graph)
+    edges = []
+    for source, targets in graph['adjacency'].items():
+        for target in targets:
+            edges.extend((node_index[source], node_index[target]))
+    return {
+        'modules': modules,
+        'nodes': [
+            [node['name'], module_index[node['module']], x, y]
+            for node, (x, y) in zip(graph['nodes'], coordinates)
+        ],
+        'edges': edges
+    }
+
+FLOW_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<style>
+  html, body { margin: 0; height: 100%; font-family: sans-serif; }
+  #flow { width: 100%; height: 100%; display: block; cursor: grab; background: #fafafa; }
+  #tooltip { position: absolute; pointer-events: none; background: #222; color: #fff; padding: 4px 8px;
+             border-radius: 4px; font-size: 12px; display: none; }
+</style>
+</head>
+<body>
+<canvas id="flow"></canvas>
+<div id="tooltip"></div>
+<script>
+const payload = __PAYLOAD__;
+const canvas = document.getElementById('flow');
+const tooltip = document.getElementById('tooltip');
+const context = canvas.getContext('2d');
+const nodes = payload.nodes, edges = payload.edges;
+const NODE_WIDTH = 150, NODE_HEIGHT = 28;
+const palette = ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f', '#edc948', '#b07aa1', '#ff9da7', '#9c755f', '#bab0ac'];
+let scale = 1, offsetX = 0, offsetY = 0, hovered = -1, dragging = null, pending = false;
+
+const neighbours = nodes.map(() => []);
+for (let i = 0; i < edges.length; i += 2) {
+  neighbours[edges[i]].push(edges[i + 1]);
+  neighbours[edges[i + 1]].push(edges[i]);
+}
+
+function resize() {
+  const ratio = window.devicePixelRatio || 1;
+  canvas.width = canvas.clientWidth * ratio;
+  canvas.height = canvas.clientHeight * ratio;
+  context.setTransform(ratio, 0, 0, ratio, 0, 0);
+  requestDraw();
+}
+
+function fit() {
+  if (!nodes.length) return;
+  let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+  for (const node of nodes) {
+    minX = Math.min(minX, node[2]); maxX = Math.max(maxX, node[2]);
+    minY = Math.min(minY, node[3]); maxY = Math.max(maxY, node[3]);
+  }
+  const width = maxX - minX + NODE_WIDTH * 2, height = maxY - minY + NODE_HEIGHT * 4;
+  scale = Math.min(canvas.clientWidth / width, canvas.clientHeight / height, 1.5);
+  offsetX = canvas.clientWidth / 2 - (minX + maxX) / 2 * scale;
+  offsetY = canvas.clientHeight / 2 - (minY + maxY) / 2 * scale;
+}
+
+function requestDraw() {
+  if (!pending) {
+    pending = true;
+    requestAnimationFrame(draw);
+  }
+}
+
+function draw() {
+  pending = false;
+  const width = canvas.clientWidth, height = canvas.clientHeight;
+  context.clearRect(0, 0, width, height);
+  context.save();
+  context.translate(offsetX, offsetY);
+  context.scale(scale, scale);
+
+  // Only nodes inside the viewport are drawn; edges are batched into a single path
+  const left = -offsetX / scale - NODE_WIDTH, right = (width - offsetX) / scale + NODE_WIDTH;
+  const top = -offsetY / scale - NODE_HEIGHT, bottom = (height - offsetY) / scale + NODE_HEIGHT;
+  context.strokeStyle = 'rgba(90, 90, 90, 0.35)';
+  context.lineWidth = 1 / scale;
+  context.beginPath();
+  for (let i = 0; i < edges.length; i += 2) {
+    const source = nodes[edges[i]], target = nodes[edges[i + 1]];
+    if (Math.max(source[2], target[2]) < left || Math.min(source[2], target[2]) > right) continue;
+    if (Math.max(source[3], target[3]) < top || Math.min(source[3], target[3]) > bottom) continue;
+    context.moveTo(source[2], source[3] + NODE_HEIGHT / 2);
+    context.lineTo(target[2], target[3] - NODE_HEIGHT / 2);
+  }
+  context.stroke();
+
+  if (hovered >= 0) {
+    context.strokeStyle = '#d62728';
+    context.lineWidth = 2 / scale;
+    context.beginPath();
+    for (let i = 0; i < edges.length; i += 2) {
+      if (edges[i] !== hovered && edges[i + 1] !== hovered) continue;
+      const source = nodes[edges[i]], target = nodes[edges[i + 1]];
+      context.moveTo(source[2], source[3] + NODE_HEIGHT / 2);
+      context.lineTo(target[2], target[3] - NODE_HEIGHT / 2);
+    }
+    context.stroke();
+  }
+
+  const showLabels = scale > 0.45;
+  context.font = '12px sans-serif';
+  context.textAlign = 'center';
+  context.textBaseline = 'middle';
+  nodes.forEach((node, index) => {
+    if (node[2] < left || node[2] > right || node[3] < top || node[3] > bottom) return;
+    context.fillStyle = palette[node[1] % palette.length];
+    context.globalAlpha = hovered < 0 || index === hovered || neighbours[hovered].includes(index) ? 1 : 0.3;
+    context.fillRect(node[2] - NODE_WIDTH / 2, node[3] - NODE_HEIGHT / 2, NODE_WIDTH, NODE_HEIGHT);
+    if (showLabels) {
+      context.fillStyle = '#fff';
+      context.fillText(node[0].length > 22 ? node[0].slice(0, 21) + '…' : node[0], node[2], node[3]);
+    }
+  });
+  context.globalAlpha = 1;
+  context.restore();
+}
+
+function nodeAt(clientX, clientY) {
+  const x = (clientX - offsetX) / scale, y = (clientY - offsetY) / scale;
+  for (let index = 0; index < nodes.length; index++) {
+    const node = nodes[index];
+    if (Math.abs(node[2] - x) <= NODE_WIDTH / 2 && Math.abs(node[3] - y) <= NODE_HEIGHT / 2) return index;
+  }
+  return -1;
+}
+
+canvas.addEventListener('wheel', (event) => {
+  event.preventDefault();
+  const factor = Math.exp(-event.deltaY * 0.0015);
+  offsetX = event.offsetX - (event.offsetX - offsetX) * factor;
+  offsetY = event.offsetY - (event.offsetY - offsetY) * factor;
+  scale *= factor;
+  requestDraw();
+}, { passive: false });
+
+canvas.addEventListener('mousedown', (event) => {
+  dragging = { x: event.clientX - offsetX, y: event.clientY - offsetY };
+  canvas.style.cursor = 'grabbing';
+});
+
+window.addEventListener('mouseup', () => {
+  dragging = null;
+  canvas.style.cursor = 'grab';
+});
+
+canvas.addEventListener('mousemove', (event) => {
+  if (dragging) {
+    offsetX = event.clientX - dragging.x;
+    offsetY = event.clientY - dragging.y;
+    requestDraw();
+    return;
+  }
+  const index = nodeAt(event.offsetX, event.offsetY);
+  if (index !== hovered) {
+    hovered = index;
+    requestDraw();
+  }
+  if (index >= 0) {
+    tooltip.textContent = payload.modules[nodes[index][1]] + '.' + nodes[index][0];
+    tooltip.style.left = (event.offsetX + 12) + 'px';
+    tooltip.style.top = (event.offsetY + 12) + 'px';
+    tooltip.style.display = 'block';
+  } else {
+    tooltip.style.display = 'none';
+  }
+});
+
+window.addEventListener('resize', resize);
+resize();
+fit();
+requestDraw();
+</script>
+</body>
+</html>
+"""
+
+def render_flow_html(payload):
+    # "</" is escaped so procedure names can never close the script block
+    return FLOW_HTML_TEMPLATE.replace('__PAYLOAD__', json.dumps(payload, separators=(',', ':')).replace('</', '<\\/'))
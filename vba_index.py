@@ -0,0 +1,317 @@
+import re
+from collections import namedtuple
+
+Token = namedtuple('Token', ['kind', 'text', 'start', 'end', 'line'])
+
+# Leading blanks are consumed by the same match so whitespace never costs a separate step
+TOKEN_PATTERN = re.compile(r"""
+  [ \t]*
+  (?:
+    (?P<continuation>(?<=[ \t])_[ \t]*(?:\r\n|\r|\n))
+  | (?P<newline>\r\n|\r|\n)
+  | (?P<comment>'[^\r\n]*)
+  | (?P<string>"[^"\r\n]*(?:""[^"\r\n]*)*"?)
+  | (?P<number>&[Hh][0-9A-Fa-f]+&?|&[Oo][0-7]+&?|(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?[%&#@]?)
+  | (?P<identifier>[A-Za-z_]\w*[%&#@$]?|\[[^\]\r\n]*\])
+  | (?P<operator>:=|<=|>=|<>|[-+*/\\^&=<>(),.!\#:;?])
+  | (?P<other>.)
+  )?
+""", re.VERBOSE)
+END_OF_LINE_PATTERN = re.compile(r'[^\r\n]*')
+
+MODIFIERS = {'public', 'private', 'friend', 'static'}
+PROCEDURE_KINDS = {'sub': 'Sub', 'function': 'Function'}
+PROPERTY_KINDS = {'get': 'Property Get', 'let': 'Property Let', 'set': 'Property Set'}
+PARAMETER_MODIFIERS = {'optional', 'byval', 'byref', 'paramarray'}
+
+KEYWORDS = {
+    'and', 'as', 'attribute', 'boolean', 'byref', 'byte', 'byval', 'call', 'case', 'close', 'const',
+    'currency', 'date', 'debug', 'declare', 'dim', 'do', 'double', 'each', 'else', 'elseif', 'empty',
+    'end', 'enum', 'eqv', 'erase', 'error', 'event', 'exit', 'explicit', 'false', 'for', 'friend',
+    'function', 'get', 'gosub', 'goto', 'if', 'imp', 'implements', 'in', 'input', 'integer', 'is',
+    'let', 'lib', 'like', 'line', 'long', 'loop', 'lset', 'me', 'mod', 'new', 'next', 'not', 'nothing',
+    'null', 'object', 'on', 'open', 'option', 'optional', 'or', 'output', 'paramarray', 'preserve',
+    'print', 'private', 'property', 'ptrsafe', 'public', 'put', 'raiseevent', 'redim', 'rem', 'resume',
+    'return', 'rset', 'select', 'set', 'single', 'static', 'step', 'stop', 'string', 'sub', 'then',
+    'to', 'true', 'type', 'typeof', 'until', 'variant', 'wend', 'while', 'with', 'withevents', 'write', 'xor'
+}
+
+# Objects whose references are recorded per procedure (with their first string argument, if any)
+OBJECT_NAMES = {
+    'activecell', 'activesheet', 'activeworkbook', 'application', 'cells', 'charts', 'columns',
+    'createobject', 'getobject', 'listobjects', 'names', 'pivottables', 'range', 'rows', 'selection',
+    'sheets', 'thisworkbook', 'workbooks', 'worksheets'
+}
+
+def tokenize(code, line=1):
+    # Streaming lexer: yields significant tokens, folding line continuations and Rem comments;
+    # line numbers count from the given first line
+    position = 0
+    at_statement_start = True
+    length = len(code)
+    while position < length:
+        match = TOKEN_PATTERN.match(code, position)
+        kind = match.lastgroup
+        if kind is None:
+            break
+        text = match.group(kind)
+        start, position = match.start(kind), match.end()
+
+        if kind == 'continuation':
+            line += 1
+            continue
+        if kind == 'identifier' and at_statement_start and text.lower() == 'rem':
+            end_of_line = END_OF_LINE_PATTERN.match(code, position).end()
+            yield Token('comment', code[start:end_of_line], start, end_of_line, line)
+            position = end_of_line
+            continue
+
+        yield Token(kind, text, start, position, line)
+        if kind == 'newline':
+            line += 1
+            at_statement_start = True
+        else:
+            at_statement_start = kind == 'operator' and text == ':'
+
+def iter_statements(tokens, comments=None, strings=None):
+    # Groups tokens into logical statements split on newlines and ':' separators; labels are dropped
+    statement = []
+    line_start = True
+    for token in tokens:
+        if token.kind == 'comment':
+            if comments is not None:
+                comments.append((token.start, token.end))
+            continue
+        if token.kind == 'string' and strings is not None:
+            strings.append((token.start, token.end))
+        if token.kind == 'newline' or (token.kind == 'operator' and token.text == ':'):
+            is_label = (
+                token.kind == 'operator' and line_start and len(statement) == 1
+                and statement[0].kind in ('identifier', 'number')
+            )
+            if statement and not is_label:
+                yield statement
+            statement = []
+            line_start = token.kind == 'newline'
+            continue
+        statement.append(token)
+    if statement:
+        yield statement
+
+def parse_declaration(statement):
+    words = [token.text.lower() for token in statement]
+    position = 0
+    while position < len(words) and words[position] in MODIFIERS:
+        position += 1
+    if position >= len(words):
+        return None
+
+    scope = words[0].title() if position else 'Public'
+    if words[position] in PROCEDURE_KINDS:
+        kind = PROCEDURE_KINDS[words[position]]
+        position += 1
+    elif words[position] == 'property' and position + 1 < len(words) and words[position + 1] in PROPERTY_KINDS:
+        kind = PROPERTY_KINDS[words[position + 1]]
+        position += 2
+    else:
+        return None
+    if position >= len(statement) or statement[position].kind != 'identifier':
+        return None
+
+    name = statement[position].text
+    position += 1
+    parameters = []
+    if position < len(statement) and statement[position].text == '(':
+        depth = 0
+        current = []
+        for token in statement[position:]:
+            position += 1
+            if token.text == '(':
+                depth += 1
+                if depth == 1:
+                    continue
+            elif token.text == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+            if depth == 1 and token.text == ',':
+                parameters.append(parse_parameter(current))
+                current = []
+            else:
+                current.append(token)
+        if current:
+            parameters.append(parse_parameter(current))
+
+    return_type = None
+    if position + 1 < len(statement) and words[position] == 'as':
+        return_type = ' '.join(token.text for token in statement[position + 1:])
+
+    return {'name': name, 'kind': kind, 'scope': scope, 'parameters': parameters, 'return_type': return_type}
+
+def parse_parameter(tokens):
+    words = [token.text.lower() for token in tokens]
+    position = 0
+    passing = 'ByRef'
+    optional = False
+    while position < len(words) and words[position] in PARAMETER_MODIFIERS:
+        if words[position] == 'byval':
+            passing = 'ByVal'
+        elif words[position] == 'optional':
+            optional = True
+        position += 1
+
+    name = tokens[position].text if position < len(tokens) else ''
+    parameter_type = None
+    default = None
+    if 'as' in words[position:]:
+        type_start = words.index('as', position) + 1
+        type_end = words.index('=', type_start) if '=' in words[type_start:] else len(tokens)
+        parameter_type = ' '.join(token.text for token in tokens[type_start:type_end])
+    if '=' in words[position:]:
+        default = ' '.join(token.text for token in tokens[words.index('=', position) + 1:])
+    return {'name': name, 'type': parameter_type, 'passing': passing, 'optional': optional, 'default': default}
+
+def is_end_of_procedure(words):
+    return len(words) >= 2 and words[0] == 'end' and words[1] in ('sub', 'function', 'property')
+
+def add_unique(values, seen, value):
+    if value.lower() not in seen:
+        seen.add(value.lower())
+        values.append(value)
+
+def string_value(token):
+    return token.text[1:-1].replace('""', '"') if token.text.endswith('"') else token.text[1:]
+
+def collect_references(statement, procedure, local_names):
+    words = [token.text.lower() for token in statement]
+
+    # Single-line If: the statements after Then/Else are analyzed on their own
+    if words[0] in ('if', 'elseif') and 'then' in words and words.index('then') + 1 < len(words):
+        then_index = words.index('then')
+        collect_references(statement[:then_index], procedure, local_names)
+        branches = [[]]
+        for token in statement[then_index + 1:]:
+            if token.text.lower() == 'else':
+                branches.append([])
+            else:
+                branches[-1].append(token)
+        for branch in branches:
+            if branch:
+                collect_references(branch, procedure, local_names)
+        return
+    calls, seen_calls = procedure['calls'], procedure['_seen_calls']
+    objects, seen_objects = procedure['objects'], procedure['_seen_objects']
+
+    if words[0] in ('dim', 'static', 'const', 'redim'):
+        for index, token in enumerate(statement[1:], start=1):
+            if token.kind == 'identifier' and words[index - 1] in ('dim', 'static', 'const', 'redim', 'preserve', ','):
+                local_names.add(words[index])
+
+    # Explicit "Call Name" and implicit "Name arg1, arg2" statements
+    target = None
+    if words[0] == 'call' and len(statement) > 1 and statement[1].kind == 'identifier':
+        target = 1
+    elif (
+        statement[0].kind == 'identifier' and words[0] not in KEYWORDS
+        and words[0] not in OBJECT_NAMES and words[0] not in local_names
+    ):
+        head = 3 if words[1:2] == ['.'] and len(statement) > 2 and statement[2].kind == 'identifier' else 1
+        assignment = head < len(words) and words[head] in ('.', '!')
+        depth = 0
+        for word in words[head:]:
+            if word == '(':
+                depth += 1
+            elif word == ')':
+                depth -= 1
+            elif depth == 0 and word == '=':
+                assignment = True
+                break
+        if not assignment:
+            target = 0
+    if target is not None:
+        name = statement[target].text
+        if target + 2 < len(statement) and statement[target + 1].text == '.' and statement[target + 2].kind == 'identifier':
+            name += '.' + statement[target + 2].text
+        add_unique(calls, seen_calls, name)
+
+    for index, token in enumerate(statement):
+        if token.kind != 'identifier':
+            continue
+        word = words[index]
+        previous = words[index - 1] if index else ''
+        following = statement[index + 1] if index + 1 < len(statement) else None
+
+        if word in OBJECT_NAMES and previous != '.' or (previous == '.' and word in ('worksheets', 'sheets', 'range', 'cells')):
+            reference = token.text
+            if following is not None and following.text == '(' and index + 2 < len(statement) and statement[index + 2].kind == 'string':
+                reference += f'("{string_value(statement[index + 2])}")'
+            add_unique(objects, seen_objects, reference)
+        elif (
+            following is not None and following.text == '(' and previous not in ('.', '!')
+            and word not in KEYWORDS and word not in local_names
+        ):
+            add_unique(calls, seen_calls, token.text)
+
+        # Application.Run "Macro" calls a procedure by name
+        if word == 'run' and previous == '.' and index >= 2 and words[index - 2] == 'application':
+            arguments = [token for token in statement[index + 1:] if token.kind == 'string']
+            if arguments:
+                add_unique(calls, seen_calls, string_value(arguments[0]).split('!')[-1].strip("'"))
+
+def index_module(module_name, module_type, code):
+    procedures = []
+    comments = []
+    strings = []
+    current = None
+    local_names = set()
+    for statement in iter_statements(tokenize(code), comments, strings):
+        words = [token.text.lower() for token in statement]
+        if current is None:
+            declaration = parse_declaration(statement)
+            if declaration is None:
+                continue
+            local_names = {parameter['name'].lower() for parameter in declaration['parameters']}
+            current = dict(declaration)
+            current.update({
+                'key': f"{module_name}.{declaration['name']} ({declaration['kind']})",
+                'module': module_name,
+                'module_type': module_type,
+                'start': statement[0].start,
+                'start_line': statement[0].line,
+                'calls': [],
+                'objects': [],
+                '_seen_calls': set(),
+                '_seen_objects': set()
+            })
+        elif is_end_of_procedure(words):
+            current['end'] = statement[-1].end
+            current['end_line'] = statement[-1].line
+            procedures.append(current)
+            current = None
+        else:
+            collect_references(statement, current, local_names)
+
+    if current is not None:
+        current['end'] = len(code)
+        current['end_line'] = code.count('\n') + 1
+        procedures.append(current)
+
+    for procedure in procedures:
+        procedure['code'] = code[procedure['start']:procedure['end']]
+        del procedure['_seen_calls'], procedure['_seen_objects']
+    return procedures, comments, strings
+
+def build_index(vba_modules):
+    index = {'procedures': [], 'modules': {}}
+    for stream_path, vba_name, vba_code in vba_modules:
+        module_name, _, module_type = vba_name.rpartition('.') if '.' in vba_name else (vba_name, '', '')
+        procedures, comments, strings = index_module(module_name, module_type, vba_code)
+        index['procedures'].extend(procedures)
+        index['modules'][module_name] = {
+            'stream_path': stream_path,
+            'type': module_type,
+            'comments': comments,
+            'strings': strings,
+            'procedures': procedures
+        }
+    return index
@@ -0,0 +1,224 @@
+from vba_index import is_end_of_procedure, iter_statements, parse_declaration, string_value, tokenize
+
+COMPLEXITY_THRESHOLD = 10
+LOOP_DEPTH_THRESHOLD = 3
+REPEATED_LOOKUP_THRESHOLD = 3
+
+LINT_RULES = {
+    'select_activate': "Select/Activate chains",
+    'range_in_loop': "Cell-by-cell Range access inside a loop",
+    'screen_updating': "Missing Application.ScreenUpdating = False",
+    'repeated_lookup': "Repeated worksheet/workbook lookups",
+    'high_complexity': "High cyclomatic complexity",
+    'deep_nesting': "Deeply nested loops"
+}
+
+# Identifiers that evaluate to a Range; members accessed on them inside a loop touch the sheet every iteration
+RANGE_NAMES = {'range', 'cells', 'rows', 'columns', 'usedrange', 'currentregion', 'offset', 'resize', 'activecell'}
+LOOKUP_NAMES = {'worksheets', 'sheets', 'workbooks'}
+
+def new_procedure(declaration, module_name, statement):
+    return {
+        'key': f"{module_name}.{declaration['name']} ({declaration['kind']})",
+        'module': module_name,
+        'name': declaration['name'],
+        'kind': declaration['kind'],
+        'start_line': statement[0].line,
+        'metrics': {'complexity': 1, 'loop_depth': 0, 'range_accesses_in_loops': 0, 'select_activate': 0},
+        'findings': [],
+        '_loops': [],
+        '_range_variables': set(),
+        '_lookups': {},
+        '_selects': [],
+        '_screen_updating': False
+    }
+
+def inspect_statement(statement, procedure):
+    words = [token.text.lower() for token in statement]
+    metrics = procedure['metrics']
+    loops = procedure['_loops']
+    range_variables = procedure['_range_variables']
+
+    # Single-line If: the condition counts once, the statements after Then/Else are inspected on their own
+    if words[0] in ('if', 'elseif'):
+        then_index = words.index('then') if 'then' in words else len(words)
+        metrics['complexity'] += 1 + sum(word in ('and', 'or') for word in words[1:then_index])
+        if then_index + 1 < len(words):
+            branch = []
+            for token in statement[then_index + 1:]:
+                if token.text.lower() == 'else':
+                    if branch:
+                        inspect_statement(branch, procedure)
+                    branch = []
+                else:
+                    branch.append(token)
+            if branch:
+                inspect_statement(branch, procedure)
+        return
+    if words[0] == 'case' and words[1:2] != ['else']:
+        metrics['complexity'] += 1
+    if words[0] in ('while', 'do') or (words[0] == 'loop' and len(words) > 1):
+        metrics['complexity'] += sum(word in ('and', 'or') for word in words)
+
+    if words[0] in ('dim', 'static', 'private', 'public') and 'as' in words:
+        for index, word in enumerate(words[:-2]):
+            if words[index + 1] == 'as' and words[index + 2] == 'range':
+                range_variables.add(word)
+
+    # Loop structure: For/For Each/Do/While open a loop, Next/Loop/Wend close it
+    if words[0] in ('for', 'do', 'while'):
+        metrics['complexity'] += 1
+        if words[:2] == ['for', 'each'] and any(word in RANGE_NAMES or word in range_variables for word in words[4:]):
+            range_variables.add(words[2])
+        loops.append({'line': statement[0].line, 'range_accesses': 0})
+        metrics['loop_depth'] = max(metrics['loop_depth'], len(loops))
+        closing = 0
+    elif words[0] == 'next':
+        closing = max(1, words.count(',') + 1)
+    elif words[0] in ('loop', 'wend'):
+        closing = 1
+    else:
+        closing = 0
+
+    for index, token in enumerate(statement):
+        if token.kind != 'identifier':
+            continue
+        word = words[index]
+        previous = words[index - 1] if index else ''
+        following = words[index + 1] if index + 1 < len(words) else ''
+
+        if (word in ('select', 'activate') and previous == '.') or (word == 'selection' and previous != '.'):
+            metrics['select_activate'] += 1
+            procedure['_selects'].append(token.line)
+        if word == 'screenupdating' and following == '=' and words[index + 2:index + 3] == ['false']:
+            procedure['_screen_updating'] = True
+        if loops and previous != 'as' and (
+            (word in RANGE_NAMES and word not in ('offset', 'resize'))
+            or (word in range_variables and following == '.')
+        ):
+            metrics['range_accesses_in_loops'] += 1
+            loops[0]['range_accesses'] += 1
+        if word in LOOKUP_NAMES and following == '(' and index + 2 < len(statement) and statement[index + 2].kind == 'string':
+            lookup = f'{token.text}("{string_value(statement[index + 2])}")'
+            entry = procedure['_lookups'].setdefault(lookup.lower(), {'lookup': lookup, 'count': 0, 'line': token.line, 'in_loop': False})
+            entry['count'] += 1
+            entry['in_loop'] = entry['in_loop'] or bool(loops)
+
+    for _ in range(min(closing, len(loops))):
+        loop = loops.pop()
+        if not loops and loop['range_accesses']:
+            procedure['findings'].append({
+                'rule': 'range_in_loop',
+                'line': loop['line'],
+                'message': f"Loop accesses the sheet cell by cell ({loop['range_accesses']} Range/Cells references in the loop body); read and write the block through an array instead"
+            })
+
+def finish_procedure(procedure, last_line, statement):
+    procedure['end_line'] = statement[-1].line if statement else last_line
+    metrics = procedure['metrics']
+    metrics['lines'] = procedure['end_line'] - procedure['start_line'] + 1
+    findings = procedure['findings']
+
+    if procedure['_selects']:
+        findings.append({
+            'rule': 'select_activate',
+            'line': procedure['_selects'][0],
+            'message': f"Uses Select/Activate/Selection {len(procedure['_selects'])} time(s); work with object references directly"
+        })
+    if (metrics['range_accesses_in_loops'] or procedure['_selects']) and not procedure['_screen_updating']:
+        findings.append({
+            'rule': 'screen_updating',
+            'line': procedure['start_line'],
+            'message': "Updates the sheet repeatedly without Application.ScreenUpdating = False"
+        })
+    for entry in procedure['_lookups'].values():
+        if entry['count'] >= REPEATED_LOOKUP_THRESHOLD or entry['in_loop']:
+            where = "inside a loop" if entry['in_loop'] else f"{entry['count']} times"
+            findings.append({
+                'rule': 'repeated_lookup',
+                'line': entry['line'],
+                'message': f"Looks up {entry['lookup']} {where}; resolve it once into a variable"
+            })
+    if metrics['complexity'] > COMPLEXITY_THRESHOLD:
+        findings.append({
+            'rule': 'high_complexity',
+            'line': procedure['start_line'],
+            'message': f"Cyclomatic complexity is {metrics['complexity']} (threshold {COMPLEXITY_THRESHOLD})"
+        })
+    if metrics['loop_depth'] >= LOOP_DEPTH_THRESHOLD:
+        findings.append({
+            'rule': 'deep_nesting',
+            'line': procedure['start_line'],
+            'message': f"Loops are nested {metrics['loop_depth']} levels deep"
+        })
+    findings.sort(key=lambda finding: finding['line'])
+    for name in ('_loops', '_range_variables', '_lookups', '_selects', '_screen_updating'):
+        del procedure[name]
+    return procedure
+
+def lint_code(code, module_name="Module", first_line=1):
+    # Single pass over the token stream; module names are taken from Attribute VB_Name lines so
+    # concatenated .bas modules are attributed correctly
+    procedures = []
+    current = None
+    last_line = first_line + code.count('\n')
+    for statement in iter_statements(tokenize(code, first_line)):
+        words = [token.text.lower() for token in statement]
+        if current is None:
+            if words[:2] == ['attribute', 'vb_name'] and statement[-1].kind == 'string':
+                module_name = string_value(statement[-1])
+                continue
+            declaration = parse_declaration(statement)
+            if declaration is not None:
+                current = new_procedure(declaration, module_name, statement)
+        elif is_end_of_procedure(words):
+            procedures.append(finish_procedure(current, last_line, statement))
+            current = None
+        else:
+            inspect_statement(statement, current)
+    if current is not None:
+        procedures.append(finish_procedure(current, last_line, None))
+    return procedures
+
+def lint_index(index, module_type='bas'):
+    # Lints each indexed procedure on its own, so lines are those of the procedure's module
+    results = []
+    for procedure in index['procedures']:
+        if procedure['module_type'] == module_type:
+            results.extend(lint_code(procedure['code'], procedure['module'], procedure['start_line']))
+    return results
+
+def flagged_procedures(results):
+    return [procedure for procedure in results if procedure['findings']]
+
+def annotate_flagged_code(index, results):
+    # LLM input: one section per flagged procedure, its findings as VBA comments followed by its code;
+    # sections are chunked whole so findings never end up in a different chunk than their code
+    code_by_key = {procedure['key']: procedure['code'] for procedure in index['procedures']}
+    sections = []
+    for procedure in flagged_procedures(results):
+        metrics = procedure['metrics']
+        lines = [
+            f"' Static analysis findings for {procedure['key']}:",
+            f"'   complexity {metrics['complexity']}, loop nesting {metrics['loop_depth']}, "
+            f"{metrics['range_accesses_in_loops']} Range access(es) inside loops"
+        ]
+        lines.extend(f"'   line {finding['line']}: {finding['message']}" for finding in procedure['findings'])
+        sections.append("\n".join(lines) + "\n" + code_by_key[procedure['key']])
+    return sections
+
+def format_lint_report(results):
+    flagged = flagged_procedures(results)
+    if not flagged:
+        return f"Static analysis checked {len(results)} procedure(s) and found no issues.\n"
+
+    report = [f"Static analysis flagged {len(flagged)} of {len(results)} procedure(s):"]
+    for procedure in flagged:
+        metrics = procedure['metrics']
+        report.append(
+            f"{procedure['key']} (lines {procedure['start_line']}-{procedure['end_line']}, "
+            f"complexity {metrics['complexity']}, loop nesting {metrics['loop_depth']}, "
+            f"{metrics['range_accesses_in_loops']} Range access(es) inside loops)"
+        )
+        report.extend(f" - line {finding['line']}: {LINT_RULES[finding['rule']]}. {finding['message']}" for finding in procedure['findings'])
+    return '\n'.join(report) + '\n'
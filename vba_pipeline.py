@@ -0,0 +1,762 @@
+import os
+import re
+import hashlib
+import itertools
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from oletools.olevba import VBA_Parser
+from langchain_core.prompts import PromptTemplate
+from cache import CACHE_DIR, DiskCache
+from job_queue import JobQueue
+from llm_backends import DEFAULT_MODELS, context_size, create_llm_client
+from llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, LLMScheduler
+from tracing import annotate, count, in_current_span, span
+from vba_callgraph import build_call_graph, graph_links, to_json
+from vba_corpus import CorpusIndex, normalize_tokens, procedure_fingerprint
+from vba_flow import build_flow_payload
+from vba_index import build_index
+from vba_lint import annotate_flagged_code, format_lint_report, lint_index
+from vba_security import format_security_report, scan_modules
+
+# Backends: groq (remote), openai (any OpenAI-compatible server, e.g. a local one) or
+# llamacpp (a llama-server process for a local GGUF model, started once and shared by every session)
+LLM_BACKEND = os.environ.get("VBA_LLM_BACKEND", "groq")
+LLM_MODEL = os.environ.get("VBA_LLM_MODEL", DEFAULT_MODELS.get(LLM_BACKEND))
+LLM_TEMPERATURE = 0
+# Responses are capped at the completion allowance the scheduler reserves for each request
+LLM_COMPLETION_TOKENS = 1024
+
+llm = create_llm_client(LLM_BACKEND, LLM_MODEL, LLM_TEMPERATURE, LLM_COMPLETION_TOKENS)
+
+def env_limit(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+# Every LLM request goes through the scheduler, which keeps within the provider's rate limits;
+# local backends have no request or token budget and default to one request at a time
+remote_backend = LLM_BACKEND == 'groq'
+llm_scheduler = LLMScheduler(
+    llm,
+    requests_per_minute=env_limit("VBA_LLM_RPM", 30 if remote_backend else None),
+    tokens_per_minute=env_limit("VBA_LLM_TPM", 5000 if remote_backend else None),
+    max_concurrency=env_limit("VBA_LLM_CONCURRENCY", 4 if remote_backend else 1),
+    completion_tokens=LLM_COMPLETION_TOKENS
+)
+
+def warm_up_llm():
+    # Local backends load the model ahead of the first analysis; remote ones need no warm-up
+    warm_up = getattr(llm, 'warm_up', None)
+    if warm_up is not None:
+        warm_up()
+
+# Parsed workbooks are cached by content hash so revisiting a workbook skips the olevba pass
+extraction_cache = DiskCache(
+    os.path.join(CACHE_DIR, "extraction.sqlite3"),
+    max_bytes=1024 * 1024 * 1024,
+    max_age=30 * 24 * 3600
+)
+
+# LLM responses are deterministic at temperature 0, so they are reused across reruns and pages
+llm_cache = DiskCache(
+    os.path.join(CACHE_DIR, "llm_responses.sqlite3"),
+    max_bytes=256 * 1024 * 1024,
+    max_age=None
+)
+
+# Per-procedure fingerprints and documentation of the last revision seen for each workbook name,
+# kept apart per model and prompt set (see revision_cache_key)
+revision_cache = DiskCache(
+    os.path.join(CACHE_DIR, "revisions.sqlite3"),
+    max_bytes=256 * 1024 * 1024,
+    max_age=90 * 24 * 3600
+)
+
+# Process-flow layouts are computed server side and cached by call-graph content
+layout_cache = DiskCache(
+    os.path.join(CACHE_DIR, "layouts.sqlite3"),
+    max_bytes=256 * 1024 * 1024,
+    max_age=30 * 24 * 3600
+)
+
+# Documentation is shared across workbooks by normalized procedure fingerprint (see vba_corpus);
+# batch.py --corpus fills the same index with the procedures of every workbook it processes
+CORPUS_PATH = os.path.join(CACHE_DIR, "corpus.sqlite3")
+corpus_index = CorpusIndex(CORPUS_PATH)
+
+# Uploads up to this size are handed to olevba as bytes; larger ones go through a temporary file
+IN_MEMORY_PARSE_LIMIT = 64 * 1024 * 1024
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_bytes(data):
+    return hashlib.sha256(memoryview(data)).hexdigest()
+
+def parse_vba_modules(vba_parser):
+    try:
+        if vba_parser.detect_vba_macros():
+            modules = [
+                [stream_path, vba_name, vba_code]
+                for _, stream_path, vba_name, vba_code in vba_parser.extract_all_macros()
+            ]
+        else:
+            modules = None
+    finally:
+        vba_parser.close()
+    return modules
+
+def extract_vba_modules(file_path):
+    # Returns a list of (stream_path, vba_name, vba_code) per module, or None if the workbook has no macros
+    with span('extract_vba_modules', bytes=os.path.getsize(file_path)) as current:
+        workbook_hash = hash_file(file_path)
+        cached = extraction_cache.get(workbook_hash)
+        current.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached['modules']
+
+        modules = parse_vba_modules(VBA_Parser(file_path))
+        extraction_cache.set(workbook_hash, {'modules': modules})
+        current.set(modules=len(modules or []))
+        return modules
+
+def extract_vba_modules_from_bytes(file_name, data, workbook_hash=None):
+    # Same as extract_vba_modules for a workbook that is already in memory (e.g. an upload)
+    with span('extract_vba_modules', bytes=len(data)) as current:
+        workbook_hash = workbook_hash or hash_bytes(data)
+        cached = extraction_cache.get(workbook_hash)
+        current.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached['modules']
+
+        if len(data) <= IN_MEMORY_PARSE_LIMIT:
+            modules = parse_vba_modules(VBA_Parser(file_name, data=data))
+        else:
+            # olevba wraps in-memory data in further buffers; large workbooks are parsed from a
+            # temporary file instead so streams are read from disk on demand
+            with tempfile.TemporaryDirectory(prefix="vba_upload_") as directory:
+                file_path = os.path.join(directory, os.path.basename(file_name))
+                with span('write_temporary_file', bytes=len(data)):
+                    with open(file_path, 'wb') as f:
+                        f.write(memoryview(data))
+                modules = parse_vba_modules(VBA_Parser(file_path))
+
+        extraction_cache.set(workbook_hash, {'modules': modules})
+        current.set(modules=len(modules or []))
+        return modules
+
+# The procedure index is built once per workbook and shared by every analysis that needs it
+MAX_INDEXED_WORKBOOKS = 32
+procedure_indexes = OrderedDict()
+procedure_index_lock = threading.Lock()
+
+def get_modules_key(vba_modules):
+    digest = hashlib.sha256()
+    for stream_path, vba_name, vba_code in vba_modules:
+        digest.update("\0".join([stream_path, vba_name, vba_code, ""]).encode('utf-8'))
+    return digest.hexdigest()
+
+def get_procedure_index(vba_modules):
+    modules_key = get_modules_key(vba_modules)
+    with procedure_index_lock:
+        index = procedure_indexes.get(modules_key)
+        if index is not None:
+            procedure_indexes.move_to_end(modules_key)
+            return index
+
+    with span('procedure_index', modules=len(vba_modules)) as current:
+        index = build_index(vba_modules)
+        current.set(procedures=len(index['procedures']))
+    with procedure_index_lock:
+        procedure_indexes[modules_key] = index
+        while len(procedure_indexes) > MAX_INDEXED_WORKBOOKS:
+            procedure_indexes.popitem(last=False)
+    return index
+
+def join_bas_modules(vba_modules):
+    code = ""
+    for _, vba_name, vba_code in vba_modules:
+        if vba_name.endswith('.bas'):
+            code += vba_code
+    # Runs of blanks and blank lines are collapsed, but line breaks are kept: they end VBA statements
+    code = re.sub(r"[ \t\f\v]+", " ", code)
+    return re.sub(r" ?(?:\r?\n ?)+", "\n", code).strip()
+
+PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION = """
+    You are a helpful assistant.
+    You are responsible for analyzing the given VBA Macro code and generating a comprehensive documentation of the underlying logic, data flow and process flow.
+    Your response must contain the underlying logic, data flow and process flow for each of the subroutines available in the given code.
+    VBA Code:{question}
+    """
+
+PROMPT_TEMPLATE_DOCUMENTATION_BATCH = """
+    You are a helpful assistant.
+    You are responsible for analyzing the given VBA Macro procedures and generating a comprehensive documentation of the underlying logic, data flow and process flow of each one.
+    Each procedure below is preceded by a header line of the form "~ Module.Name (Kind)".
+    Document every procedure in the given order, and start the documentation of each one with its header line, copied exactly, on a line of its own.
+    VBA Code:{question}
+    """
+
+PROMPT_TEMPLATE_FUNCTIONAL_LOGIC = """
+    You are a helpful assistant.
+    You are responsible for extracting and explaining the functional logic embedded within the given VBA macro.
+    Your response should help technical and non-technical stakeholders understand the business logic, supporting better decision-making
+    and transformation efforts.
+    VBA Code:{question}
+    """
+
+PROMPT_TEMPLATE_CODE_QUALITY = """
+    Please analyze the provided VBA Macro code and evaluate its quality and efficiency.
+    Identify potential inefficiencies, redundant code, and optimization opportunities to improve macro performance and reliability.
+    Pay particular attention in analyzing:
+      Code Efficiency: Assess if the code is optimized for speed and resource usage.
+      Redundant Code: Identify any sections of code that repeat functionality unnecessarily.
+      Optimization Opportunities: Suggest improvements or optimizations that could enhance the macro's performance.
+    Please provide only a detailed feedback on each of these aspects to guide improvements in the given VBA Macro code.
+    Do not provide any VBA code as a part of the response.
+    Only the procedures flagged by static analysis are included; the comments above each procedure list its findings. Confirm, explain and extend them.
+    Here is the VBA Macro code snippet:
+    VBA Code:{question}
+    """
+
+PROMPT_TEMPLATE_DATA_FLOW = """
+    Please analyze the provided VBA Macro code and evaluate the data flow within the macros.
+    Identify bottlenecks and opportunities for optimization to enhance efficiency and performance in data processing tasks. Specifically, focus on:
+    Data Flow Analysis: Map out how data moves through the macro from input to output.
+    Bottlenecks: Identify points in the code where data processing slows down or encounters inefficiencies.
+    Optimization Opportunities: Recommend changes or optimizations to streamline data processing and improve overall performance.
+    Resource Usage: Assess how efficiently resources are utilized during data processing.
+    Scalability: Consider how well the macro handles varying data volumes and complexity.
+
+    Please provide detailed insights and recommendations to optimize the VBA Macro code for improved efficiency and performance in data processing tasks.
+    Only the procedures flagged by static analysis are included; the comments above each procedure list its findings. Confirm, explain and extend them.
+    Here is the VBA Macro code snippet:
+    VBA Code:{question}
+    """
+
+PROMPT_TEMPLATE_REFACTOR = """
+    Please provide recommendations for refactoring or rewriting the given VBA Macro code (only if necessary) using modern programming languages and technologies to enhance maintainability, scalability, and performance.
+    Consider the following:
+      Language and Technology Recommendations: Suggest suitable modern programming languages (e.g., Python) and technologies (e.g., APIs) that align with the macro's functionality.
+      Refactoring Strategies: Recommend specific refactoring techniques to improve code structure, readability, and maintainability.
+      Integration Possibilities: Explore integration options with other systems or platforms for enhanced functionality and interoperability.
+      Performance Optimization: Identify opportunities to optimize code performance and efficiency in the new environment.
+      Compatibility Considerations: Address compatibility issues or considerations when transitioning from VBA to modern languages or technologies.
+
+    Please provide detailed guidance on how to effectively modernize the VBA Macro code, ensuring it meets current industry standards and best practices.
+
+    Here is the VBA Macro code snippet:
+    VBA Code:{question}
+    """
+
+def llm_cache_key(prompt_template, vba_code):
+    normalized_code = re.sub(r"\s+", " ", vba_code).strip()
+    code_hash = hashlib.sha256(normalized_code.encode('utf-8')).hexdigest()
+    key_parts = "\0".join([prompt_template, LLM_BACKEND, LLM_MODEL, str(LLM_TEMPERATURE), code_hash])
+    return hashlib.sha256(key_parts.encode('utf-8')).hexdigest()
+
+def run_prompt(prompt_template, vba_code, priority=PRIORITY_INTERACTIVE):
+    cache_key = llm_cache_key(prompt_template, vba_code)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        count('llm_cache_hits')
+        return cached
+
+    count('llm_cache_misses')
+    prompt = PromptTemplate(template=prompt_template)
+    query_with_prompt = prompt.format(question=vba_code)
+    response = llm_scheduler.invoke(query_with_prompt, priority)
+    llm_cache.set(cache_key, response)
+    return response
+
+def stream_prompt(prompt_template, vba_code, priority=PRIORITY_INTERACTIVE):
+    # Yields the response as it is generated; the generator's return value is the complete text
+    cache_key = llm_cache_key(prompt_template, vba_code)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        count('llm_cache_hits')
+        yield cached
+        return cached
+
+    count('llm_cache_misses')
+    prompt = PromptTemplate(template=prompt_template)
+    query_with_prompt = prompt.format(question=vba_code)
+    pieces = []
+    for piece in llm_scheduler.stream(query_with_prompt, priority):
+        pieces.append(piece)
+        yield piece
+    response = "".join(pieces)
+    llm_cache.set(cache_key, response)
+    return response
+
+PROMPT_TEMPLATE_REDUCE = """
+    You are a helpful assistant.
+    The given VBA Macro code was too large to analyze at once, so it was split into parts and each part was analyzed separately using the following instructions:
+    {instructions}
+    Merge the partial analyses below into a single coherent response that follows the same instructions.
+    Remove repetition between the parts, but keep the details for every subroutine and function.
+    Partial Analyses:{question}
+    """
+
+# Large macro projects are split on module and Sub/Function boundaries and packed into
+# chunks that fit the token budget; chunks are analyzed in parallel and merged by a reduce prompt
+MAX_CHUNK_TOKENS = 6000
+CHARS_PER_TOKEN = 4
+CONTEXT_CHARS_PER_TOKEN = 3
+CHUNK_BOUNDARY_PATTERN = re.compile(
+    r'\bAttribute\s+VB_Name\b'
+    r'|(?<!End )(?<!Exit )\b(?:(?:Public|Private|Friend|Static)\s+)*'
+    r'(?:Sub|Function|Property\s+(?:Get|Let|Set))\s+\w+',
+    re.IGNORECASE
+)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def reduce_template_for(prompt_template):
+    instructions = prompt_template.replace('VBA Code:{question}', '').strip()
+    return PROMPT_TEMPLATE_REDUCE.replace('{instructions}', instructions)
+
+def chunk_token_budget(tokens_per_minute, completion_tokens, context_size=None):
+    # A chunk, the prompt around it and the completion allowance must fit in one minute of the token
+    # budget, or the scheduler could never admit the request, and in the model's context window.
+    # Reduce prompts repeat their template's instructions, so they are the longest prompts a chunk is sent with.
+    limits = [limit for limit in (tokens_per_minute,) if limit is not None]
+    if context_size is not None:
+        # The context window is a hard limit and tokenizers split VBA code into about one token per
+        # CONTEXT_CHARS_PER_TOKEN characters, fewer than the estimate assumes, so the prompt's share of
+        # the window is converted to estimated tokens
+        prompt_share = (context_size - completion_tokens) * CONTEXT_CHARS_PER_TOKEN // CHARS_PER_TOKEN
+        limits.append(completion_tokens + prompt_share)
+    if not limits:
+        return MAX_CHUNK_TOKENS
+    templates = [
+        PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION, PROMPT_TEMPLATE_FUNCTIONAL_LOGIC, PROMPT_TEMPLATE_CODE_QUALITY,
+        PROMPT_TEMPLATE_DATA_FLOW, PROMPT_TEMPLATE_REFACTOR
+    ]
+    overhead = max(estimate_tokens(reduce_template_for(template)) for template in templates)
+    budget = min(MAX_CHUNK_TOKENS, min(limits) - completion_tokens - overhead)
+    if budget <= 0:
+        raise ValueError(
+            f"A limit of {min(limits)} tokens per request leaves no room for VBA code after {overhead} prompt "
+            f"and {completion_tokens} completion tokens; raise VBA_LLM_TPM or the model's context size"
+        )
+    return budget
+
+CHUNK_TOKEN_BUDGET = chunk_token_budget(
+    llm_scheduler.tokens_per_minute, llm_scheduler.completion_tokens, context_size(LLM_BACKEND)
+)
+
+def split_oversized(segment, max_chars):
+    pieces = []
+    while len(segment) > max_chars:
+        cut = segment.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(segment[:cut])
+        segment = segment[cut:]
+    pieces.append(segment)
+    return pieces
+
+def pack_segments(segments, token_budget, separator=""):
+    chunks = []
+    current = ""
+    for segment in segments:
+        candidate = current + separator + segment if current else segment
+        if current and estimate_tokens(candidate) > token_budget:
+            chunks.append(current)
+            current = segment
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_vba_code(vba_code, token_budget=CHUNK_TOKEN_BUDGET):
+    if estimate_tokens(vba_code) <= token_budget:
+        return [vba_code]
+
+    boundaries = [match.start() for match in CHUNK_BOUNDARY_PATTERN.finditer(vba_code)]
+    boundaries = [0] + [position for position in boundaries if position > 0] + [len(vba_code)]
+
+    max_chars = token_budget * CHARS_PER_TOKEN
+    segments = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        segments.extend(split_oversized(vba_code[start:end], max_chars))
+
+    return pack_segments(segments, token_budget)
+
+def chunk_sections(sections, token_budget=CHUNK_TOKEN_BUDGET):
+    # Packs self-contained sections into chunks; a section is only split when it is too large on its own
+    segments = []
+    for section in sections:
+        segments.extend(chunk_vba_code(section, token_budget))
+    return pack_segments(segments, token_budget, separator="\n\n")
+
+def parallel_map(function, items):
+    # Results in order, each computed on a thread of this call's own. The threads mostly wait in the
+    # LLM scheduler, which admits requests in priority order; a shared bounded pool would instead let
+    # a prefetch's queued map steps hold up the steps of the page being viewed.
+    executor = ThreadPoolExecutor(max_workers=max(1, min(len(items), llm_scheduler.max_concurrency)))
+    results = executor.map(in_current_span(function), items)
+    # The threads exit once the submitted calls have finished
+    executor.shutdown(wait=False)
+    return results
+
+def label_partials(partials):
+    return [f"Part {index}: {partial}" for index, partial in enumerate(partials, start=1)]
+
+def shrink_partials(partials, token_budget=CHUNK_TOKEN_BUDGET):
+    # Cuts every partial to half the budget, so any two of them fit one reduce prompt together
+    label_chars = len(label_partials([""] * len(partials))[-1]) + len("\n\n")
+    max_chars = token_budget // 2 * CHARS_PER_TOKEN - label_chars - CHARS_PER_TOKEN
+    return [partial[:max_chars] for partial in partials]
+
+def final_reduce_input(reduce_template, partials, priority=PRIORITY_INTERACTIVE):
+    # Merge in rounds so the reduce prompt itself never outgrows the token budget;
+    # returns the input of the last reduce prompt
+    while True:
+        groups = pack_segments(label_partials(partials), CHUNK_TOKEN_BUDGET, separator="\n\n")
+        if len(groups) == 1:
+            return groups[0]
+        if len(groups) == len(partials):
+            # No two partials fit one prompt together, so merging them would never make progress
+            count('shrunk_partials')
+            partials = shrink_partials(partials)
+            continue
+        partials = list(parallel_map(lambda group: run_prompt(reduce_template, group, priority), groups))
+
+def map_chunks(prompt_template, chunks, priority=PRIORITY_INTERACTIVE):
+    return list(parallel_map(lambda chunk: run_prompt(prompt_template, chunk, priority), chunks))
+
+def run_analysis(prompt_template, vba_code, priority=PRIORITY_INTERACTIVE, chunks=None):
+    # chunks, if given, replace the default split of vba_code
+    chunks = chunks or chunk_vba_code(vba_code)
+    if len(chunks) == 1:
+        return run_prompt(prompt_template, chunks[0], priority)
+
+    reduce_template = reduce_template_for(prompt_template)
+    partials = map_chunks(prompt_template, chunks, priority)
+    return run_prompt(reduce_template, final_reduce_input(reduce_template, partials, priority), priority)
+
+def stream_analysis(prompt_template, vba_code, priority=PRIORITY_INTERACTIVE, chunks=None):
+    # Same as run_analysis, but the final (or only) prompt is streamed
+    chunks = chunks or chunk_vba_code(vba_code)
+    if len(chunks) == 1:
+        return (yield from stream_prompt(prompt_template, chunks[0], priority))
+
+    reduce_template = reduce_template_for(prompt_template)
+    reduce_input = final_reduce_input(reduce_template, map_chunks(prompt_template, chunks, priority), priority)
+    return (yield from stream_prompt(reduce_template, reduce_input, priority))
+
+ANALYSIS_PROMPTS = {
+    'functional_logic': PROMPT_TEMPLATE_FUNCTIONAL_LOGIC,
+    'code_quality': PROMPT_TEMPLATE_CODE_QUALITY,
+    'data_flow': PROMPT_TEMPLATE_DATA_FLOW,
+    'refactor': PROMPT_TEMPLATE_REFACTOR
+}
+
+# Analyses run as background jobs keyed by (workbook key, analysis), so they survive Streamlit
+# reruns and page switches; every page and session asking for the same analysis shares one job.
+# Job threads mostly wait on the LLM scheduler, which does the real admission control.
+MAX_JOB_WORKERS = 2 * (len(ANALYSIS_PROMPTS) + 1)
+MAX_JOBS = 256
+
+# Finished results are kept on disk for refreshes, other tabs and restarts; the namespace keeps
+# results of another model or prompt set from being served
+job_store = DiskCache(
+    os.path.join(CACHE_DIR, "jobs.sqlite3"),
+    max_bytes=256 * 1024 * 1024,
+    max_age=30 * 24 * 3600
+)
+JOB_NAMESPACE = hashlib.sha256("\0".join([
+    LLM_BACKEND, str(LLM_MODEL), str(LLM_TEMPERATURE), PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION,
+    PROMPT_TEMPLATE_DOCUMENTATION_BATCH, PROMPT_TEMPLATE_REDUCE, *ANALYSIS_PROMPTS.values()
+]).encode('utf-8')).hexdigest()
+
+# Module-level state outlives Streamlit script reruns because imported modules are not re-executed
+job_queue = JobQueue(max_workers=MAX_JOB_WORKERS, store=job_store, namespace=JOB_NAMESPACE, max_jobs=MAX_JOBS)
+
+def workbook_key(vba_code):
+    return hashlib.sha256(re.sub(r"\s+", " ", vba_code).strip().encode('utf-8')).hexdigest()
+
+def submit_job(vba_code, analysis, function, *args, priority=PRIORITY_INTERACTIVE):
+    # The job queue passes the priority to function as its last argument
+    return job_queue.submit((workbook_key(vba_code), analysis), function, *args, priority=priority)
+
+# Code quality and data flow only send the procedures flagged by the static analyzer to the LLM,
+# each annotated with its findings
+STATIC_PREFILTERED_ANALYSES = {'code_quality', 'data_flow'}
+NO_FLAGGED_PROCEDURES = "Static analysis found no procedures with quality or performance issues, so no further review was needed."
+MAX_LINTED_WORKBOOKS = 32
+lint_results = OrderedDict()
+lint_lock = threading.Lock()
+
+def lint_vba_modules(vba_modules):
+    # The .bas procedures of the shared index are linted one by one, so every reported line is a
+    # line of the module the procedure belongs to
+    modules_key = get_modules_key(vba_modules)
+    with lint_lock:
+        results = lint_results.get(modules_key)
+        if results is not None:
+            lint_results.move_to_end(modules_key)
+            return results
+
+    index = get_procedure_index(vba_modules)
+    with span('static_analysis', modules=len(vba_modules)) as current:
+        results = lint_index(index)
+        current.set(procedures=len(results), flagged=sum(1 for procedure in results if procedure['findings']))
+    with lint_lock:
+        lint_results[modules_key] = results
+        while len(lint_results) > MAX_LINTED_WORKBOOKS:
+            lint_results.popitem(last=False)
+    return results
+
+def static_analysis_report(vba_modules):
+    return format_lint_report(lint_vba_modules(vba_modules))
+
+def analysis_chunks(vba_code, vba_modules, analysis):
+    # The chunks an analysis sends to the LLM; empty when static analysis flagged nothing
+    if analysis not in STATIC_PREFILTERED_ANALYSES:
+        return chunk_vba_code(vba_code)
+    return chunk_sections(annotate_flagged_code(get_procedure_index(vba_modules), lint_vba_modules(vba_modules)))
+
+def run_named_analysis(vba_code, vba_modules, analysis, priority=PRIORITY_INTERACTIVE):
+    chunks = analysis_chunks(vba_code, vba_modules, analysis)
+    if not chunks:
+        return NO_FLAGGED_PROCEDURES
+    return run_analysis(ANALYSIS_PROMPTS[analysis], vba_code, priority, chunks)
+
+def generate_named_analysis(vba_code, vba_modules, analysis, priority=PRIORITY_INTERACTIVE):
+    chunks = analysis_chunks(vba_code, vba_modules, analysis)
+    if not chunks:
+        yield NO_FLAGGED_PROCEDURES
+        return NO_FLAGGED_PROCEDURES
+    return (yield from stream_analysis(ANALYSIS_PROMPTS[analysis], vba_code, priority, chunks))
+
+def submit_named_analysis(vba_code, vba_modules, analysis, priority=PRIORITY_INTERACTIVE):
+    # Streamed in the background, so pages polling the job see the response as it is generated
+    return submit_job(vba_code, analysis, generate_named_analysis, vba_code, vba_modules, analysis, priority=priority)
+
+def prefetch_analyses(vba_code, vba_modules, current=None):
+    # Speculative runs for the other pages queue behind requests for the page being viewed
+    analyses = [analysis for analysis in ANALYSIS_PROMPTS if analysis != current]
+    return submit_analyses(vba_code, vba_modules, analyses, PRIORITY_PREFETCH)
+
+def submit_analyses(vba_code, vba_modules, analyses=None, priority=PRIORITY_INTERACTIVE):
+    if analyses is None:
+        analyses = list(ANALYSIS_PROMPTS)
+
+    return {analysis: submit_named_analysis(vba_code, vba_modules, analysis, priority) for analysis in analyses}
+
+def run_analyses(vba_code, vba_modules, analyses=None):
+    futures = submit_analyses(vba_code, vba_modules, analyses)
+    return {analysis: future.result() for analysis, future in futures.items()}
+
+# Documentation is produced per procedure: each Sub/Function body is fingerprinted and only
+# procedures that changed since the previous revision of the workbook go back to the LLM.
+# Revisions and reused documentation are kept per model and prompt set, like llm_cache_key.
+DOCUMENTATION_NAMESPACE = hashlib.sha256("\0".join([
+    LLM_BACKEND, str(LLM_MODEL), str(LLM_TEMPERATURE), PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION,
+    PROMPT_TEMPLATE_DOCUMENTATION_BATCH, PROMPT_TEMPLATE_REDUCE
+]).encode('utf-8')).hexdigest()
+
+def fingerprint_procedure(code):
+    return hashlib.sha256(re.sub(r"\s+", " ", code).strip().encode('utf-8')).hexdigest()
+
+def revision_cache_key(revision_key):
+    return hashlib.sha256("\0".join([DOCUMENTATION_NAMESPACE, revision_key]).encode('utf-8')).hexdigest()
+
+# Undocumented procedures are sent in batches that fit the chunk budget, each marked by a "~ <key>"
+# header the response is split on. Every response is capped at the completion allowance, so a batch
+# also holds no more procedures than that allowance can document.
+DOCUMENTATION_TOKENS_PER_PROCEDURE = 200
+MAX_BATCHED_PROCEDURES = max(1, LLM_COMPLETION_TOKENS // DOCUMENTATION_TOKENS_PER_PROCEDURE)
+
+def batch_input(batch):
+    # Starts on a new line, so the first header is a line of its own after "VBA Code:" as well
+    return "".join(f"\n~ {procedure['key']}\n{procedure['code']}\n" for procedure in batch)
+
+def documentation_batches(procedures, token_budget=CHUNK_TOKEN_BUDGET, max_procedures=MAX_BATCHED_PROCEDURES):
+    batches = []
+    current = []
+    tokens = 0
+    for procedure in procedures:
+        size = estimate_tokens(batch_input([procedure]))
+        if current and (tokens + size > token_budget or len(current) == max_procedures):
+            batches.append(current)
+            current = []
+            tokens = 0
+        current.append(procedure)
+        tokens += size
+    if current:
+        batches.append(current)
+    return batches
+
+def split_batch_documentation(response, keys):
+    # Documentation per key, taken from the text after its header line; keys the response skipped are left out
+    header_pattern = re.compile(
+        r'^[#*> \t]*~\s*(' + '|'.join(re.escape(key) for key in keys) + r')[*: \t]*$', re.MULTILINE
+    )
+    headers = list(header_pattern.finditer(response))
+    documentation = {}
+    for header, following in zip(headers, headers[1:] + [None]):
+        text = response[header.end():following.start() if following else len(response)].strip()
+        if text and header.group(1) not in documentation:
+            documentation[header.group(1)] = text
+    return documentation
+
+def document_batch(batch, priority=PRIORITY_INTERACTIVE):
+    # A procedure on its own (too large to share a batch, or left over) is chunked like the analyses,
+    # so one larger than the token budget is mapped and reduced
+    if len(batch) == 1:
+        return [run_analysis(PROMPT_TEMPLATE_VBA_MACRO_DOCUMENTATION, batch[0]['code'], priority)]
+    response = run_prompt(PROMPT_TEMPLATE_DOCUMENTATION_BATCH, batch_input(batch), priority)
+    documented = split_batch_documentation(response, [procedure['key'] for procedure in batch])
+    missing = [procedure for procedure in batch if procedure['key'] not in documented]
+    if missing:
+        # Procedures whose header the model dropped are documented one at a time
+        count('unbatched_procedures', len(missing))
+        retried = parallel_map(lambda procedure: document_batch([procedure], priority)[0], missing)
+        documented.update(zip([procedure['key'] for procedure in missing], retried))
+    return [documented[procedure['key']] for procedure in batch]
+
+def stream_procedure_documentation(vba_modules, revision_key, priority=PRIORITY_INTERACTIVE):
+    # Yields each procedure's documentation section in order as soon as it is available. The result
+    # holds each procedure's fingerprint and documentation; the revision is only recorded by
+    # record_documentation_revision, so a stored job never replays the changes of its first run.
+    procedures = [
+        procedure for procedure in get_procedure_index(vba_modules)['procedures']
+        if procedure['module_type'] == 'bas'
+    ]
+    previous = revision_cache.get(revision_cache_key(revision_key), {}).get('procedures', {})
+
+    current = {}
+    stale = 0
+    reused = 0
+    undocumented = []
+    procedure_ids = {}
+    for procedure in procedures:
+        fingerprint = fingerprint_procedure(procedure['code'])
+        known = previous.get(procedure['key'])
+        if known and known['fingerprint'] == fingerprint:
+            current[procedure['key']] = known
+            continue
+        stale += 1
+        # An identical procedure documented in another workbook (or revision) is reused as is
+        procedure_id = procedure_fingerprint(normalize_tokens(procedure['code']))
+        documentation = corpus_index.get_documentation(DOCUMENTATION_NAMESPACE, procedure_id)
+        current[procedure['key']] = {'fingerprint': fingerprint, 'documentation': documentation}
+        if documentation is None:
+            undocumented.append(procedure)
+            procedure_ids[procedure['key']] = procedure_id
+        else:
+            reused += 1
+
+    def document(batch):
+        documentation = document_batch(batch, priority)
+        for procedure, text in zip(batch, documentation):
+            corpus_index.set_documentation(DOCUMENTATION_NAMESPACE, procedure_ids[procedure['key']], text)
+        return documentation
+
+    batches = documentation_batches(undocumented)
+    annotate(procedures=len(procedures), stale=stale, reused=reused, batches=len(batches))
+    stale_documentation = itertools.chain.from_iterable(parallel_map(document, batches))
+    for position, procedure in enumerate(procedures):
+        entry = current[procedure['key']]
+        if entry['documentation'] is None:
+            entry['documentation'] = next(stale_documentation)
+        section = documentation_section(procedure['key'], entry)
+        yield section if not position else "  " + section
+    return current
+
+def documentation_section(key, entry):
+    return f"~ {key}  {entry['documentation']}"
+
+def documentation_text(procedures):
+    return "  ".join(documentation_section(key, entry) for key, entry in procedures.items())
+
+def record_documentation_revision(revision_key, procedures):
+    # Compares a documentation result with the last revision recorded under the same name and
+    # records it as the new last revision
+    cache_key = revision_cache_key(revision_key)
+    previous = revision_cache.get(cache_key, {}).get('procedures', {})
+    revision_cache.set(cache_key, {'procedures': procedures})
+    return {
+        'added': [key for key in procedures if key not in previous],
+        'changed': [
+            key for key, entry in procedures.items()
+            if key in previous and previous[key]['fingerprint'] != entry['fingerprint']
+        ],
+        'removed': [key for key in previous if key not in procedures],
+        'unchanged': sum(
+            1 for key, entry in procedures.items()
+            if key in previous and previous[key]['fingerprint'] == entry['fingerprint']
+        )
+    }
+
+def document_procedures(vba_modules, revision_key, priority=PRIORITY_INTERACTIVE):
+    sections = stream_procedure_documentation(vba_modules, revision_key, priority)
+    while True:
+        try:
+            next(sections)
+        except StopIteration as finished:
+            procedures = finished.value
+            return documentation_text(procedures), record_documentation_revision(revision_key, procedures)
+
+def submit_documentation(vba_code, vba_modules, revision_key, priority=PRIORITY_INTERACTIVE):
+    return submit_job(
+        vba_code, 'documentation', stream_procedure_documentation, vba_modules, revision_key, priority=priority
+    )
+
+def format_vba_content(content):
+    paragraphs = content.split('  ')
+    formatted_content = ""
+    
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if paragraph.startswith('Functional Logic:'):
+            formatted_content += f"**{paragraph}**\n\n"
+        elif paragraph.startswith('-'):
+            formatted_content += f"<ul><li>{paragraph[1:].strip()}</li></ul>\n\n"
+        elif paragraph.startswith('~'):
+            formatted_content += f"<h4>{paragraph}</h4>\n\n"
+        else:
+            formatted_content += f"{paragraph}\n\n"
+
+    return formatted_content
+
+def get_call_graph(vba_modules):
+    return build_call_graph(get_procedure_index(vba_modules))
+
+def extract_nodes_and_links(vba_modules):
+    call_graph = get_call_graph(vba_modules)
+    nodes = [node['id'] for node in call_graph['nodes']]
+    return nodes, graph_links(call_graph)
+
+def get_flow_payload(vba_modules):
+    call_graph = get_call_graph(vba_modules)
+    graph_key = hashlib.sha256(to_json(call_graph).encode('utf-8')).hexdigest()
+    with span('flow_layout', nodes=len(call_graph['nodes'])) as current:
+        payload = layout_cache.get(graph_key)
+        current.set(cache_hit=payload is not None)
+        if payload is None:
+            payload = build_flow_payload(call_graph)
+            layout_cache.set(graph_key, payload)
+    return payload
+
+def build_security_report(vba_modules):
+    index = get_procedure_index(vba_modules)
+    with span('security_scan', modules=len(vba_modules)) as current:
+        findings = scan_modules(vba_modules, index)
+        current.set(findings=len(findings))
+    return format_security_report(findings), findings
+
+def check_vba_security(vba_modules):
+    security_report, _ = build_security_report(vba_modules)
+    return security_report
@@ -0,0 +1,116 @@
+import re
+from bisect import bisect_right
+
+# Rule catalog: (rule id, category, description, pattern).
+# All rules are compiled into one alternation so each module is scanned in a single pass. Python's re
+# tries every alternative at each offset, so the alternation is guarded to start only where a word or
+# string literal starts; without the guard one pass costs more than a separate sweep per rule.
+SECURITY_RULES = [
+    ('shell', 'risky', "Runs an external program", r'\bShell\b'),
+    ('shell_execute', 'risky', "Runs an external program through the Windows shell", r'\bShellExecute\w*\b'),
+    ('execute', 'risky', "Executes dynamically built code or Excel 4 macros", r'\bExecute(?:Excel4Macro)?\b'),
+    ('activex', 'risky', "Uses ActiveX controls", r'\bActiveX\b'),
+    ('create_object', 'risky', "Instantiates a COM object", r'\bCreateObject\b'),
+    ('get_object', 'risky', "Attaches to a running COM object", r'\bGetObject\b'),
+    ('wscript', 'risky', "Uses Windows Script Host", r'\bWScript\b'),
+    ('powershell', 'risky', "Launches PowerShell or the command interpreter", r'\bpowershell\b|\bcmd(?:\.exe)?\s+/[ck]\b'),
+    ('url_download', 'risky', "Downloads files from the internet", r'\bURLDownloadToFile\w*\b'),
+    ('http_request', 'risky', "Sends HTTP requests", r'\b(?:MSXML2\.)?(?:Server)?XMLHTTP(?:\.\d\.\d)?\b|\bWinHttp\.WinHttpRequest\b'),
+    ('kill', 'risky', "Deletes files", r'\bKill\b'),
+    ('file_system', 'risky', "Modifies the file system", r'\b(?:FileCopy|RmDir|MkDir|Scripting\.FileSystemObject)\b'),
+    ('environ', 'risky', "Reads environment variables", r'\bEnviron\$?(?!\w)'),
+    ('send_keys', 'risky', "Simulates keystrokes", r'\bSendKeys\b'),
+    ('call_by_name', 'risky', "Calls members by name at run time", r'\bCallByName\b'),
+    ('declare', 'risky', "Declares a Windows API function", r'\bDeclare\s+(?:PtrSafe\s+)?(?:Function|Sub)\b'),
+    ('registry', 'risky', "Reads or writes the registry", r'\b(?:RegWrite|RegRead|RegDelete|SaveSetting|DeleteSetting)\b'),
+    ('auto_exec', 'risky', "Runs automatically when the document is opened or closed",
+     r'\b(?:Auto_?Open|Auto_?Close|AutoExec|Workbook_Open|Workbook_BeforeClose|Workbook_Activate|Document_Open|Document_Close)\b'),
+    ('sql_concatenation', 'sql', "SQL statement built by string concatenation",
+     r'"[^"\r\n]*\b(?:SELECT\b[^"\r\n]*\bFROM|INSERT\s+INTO|UPDATE\s+\S+\s+SET|DELETE\s+FROM|WHERE)\b[^"\r\n]*"\s*&'),
+    ('error_handling', 'error_handling', "Error handler", r'\bOn\s+Error\b'),
+]
+
+SECURITY_PATTERN = re.compile(
+    r'(?<!\w)(?=[A-Za-z"])(?:' + '|'.join(f'(?P<{rule_id}>{pattern})' for rule_id, _, _, pattern in SECURITY_RULES) + ')',
+    re.IGNORECASE
+)
+RULES_BY_ID = {rule_id: (category, description) for rule_id, category, description, _ in SECURITY_RULES}
+
+# Rules that describe ProgIDs, commands or SQL and are therefore expected inside string literals;
+# every other rule only counts in code
+STRING_RULES = {'wscript', 'powershell', 'http_request', 'file_system', 'sql_concatenation'}
+
+def span_at(spans, span_starts, offset):
+    index = bisect_right(span_starts, offset) - 1
+    if index >= 0 and offset < spans[index][1]:
+        return index
+    return None
+
+def scan_modules(vba_modules, index):
+    findings = []
+    for _, vba_name, vba_code in vba_modules:
+        module_name = vba_name.rsplit('.', 1)[0]
+        module_index = index['modules'][module_name]
+        comments = module_index['comments']
+        comment_starts = [start for start, _ in comments]
+        strings = module_index['strings']
+        string_starts = [start for start, _ in strings]
+        procedures = module_index['procedures']
+        procedure_spans = [(procedure['start'], procedure['end']) for procedure in procedures]
+        procedure_starts = [start for start, _ in procedure_spans]
+        line_starts = [0] + [match.end() for match in re.finditer(r'\n', vba_code)]
+
+        for match in SECURITY_PATTERN.finditer(vba_code):
+            offset = match.start()
+            if span_at(comments, comment_starts, offset) is not None:
+                continue
+            if match.lastgroup not in STRING_RULES and span_at(strings, string_starts, offset) is not None:
+                continue
+
+            line_index = bisect_right(line_starts, offset) - 1
+            procedure_index = span_at(procedure_spans, procedure_starts, offset)
+            procedure_name = procedures[procedure_index]['name'] if procedure_index is not None else None
+
+            category, description = RULES_BY_ID[match.lastgroup]
+            findings.append({
+                'rule': match.lastgroup,
+                'category': category,
+                'description': description,
+                'match': match.group(0),
+                'module': module_name,
+                'procedure': procedure_name,
+                'line': line_index + 1
+            })
+    return findings
+
+def format_location(finding):
+    location = finding['module']
+    if finding['procedure']:
+        location += f".{finding['procedure']}"
+    return f"{location}, line {finding['line']}"
+
+def format_security_report(findings):
+    risks_found = [finding for finding in findings if finding['category'] == 'risky']
+    sanitization_issues = [finding for finding in findings if finding['category'] == 'sql']
+    error_handling = any(finding['category'] == 'error_handling' for finding in findings)
+
+    report = []
+
+    if risks_found:
+        report.append("Risky Patterns Found:")
+        report.extend([f" - {finding['match']}: {finding['description']} ({format_location(finding)})" for finding in risks_found])
+        report.append("The above listed functions pose a security risk. They may execute external applications, which could be exploited by attackers.\n")
+    else:
+        report.append("No risky patterns identified in the given VBA Macro.\n")
+
+    if not error_handling:
+        report.append("Error Handling: \nNot present. Proper error handling is crucial to prevent the system from exposing sensitive information during errors and to ensure that the application behaves securely and predictably.\n")
+
+    if sanitization_issues:
+        report.append("Sanitization Issues Found:")
+        report.extend([f" - {finding['description']} ({format_location(finding)})" for finding in sanitization_issues])
+        report.append("The above listed SQL statements may be vulnerable to SQL injection if not properly parameterized. Ensure that SQL queries are constructed using parameterized queries or stored procedures to prevent injection attacks.\n")
+    else:
+        report.append("All user inputs are properly sanitized, reducing the risk of injection attacks.\n")
+
+    return '\n'.join(report)